@@ -1,5 +1,7 @@
+import os
 import string
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 
 
 data = open("input/day_05.txt").read().strip()
@@ -21,25 +23,116 @@ def reduce_polymer(polymer):
     return ''.join(stack)
 
 
+def cancel_into(stack, reduced):
+    """
+    Append an already reduced polymer onto a stack of reduced units, in place. Only the seam can react, so
+    pop while the top of the stack cancels against the next unit, then extend with whatever is left.
+    """
+    cancelled = 0
+
+    while stack and cancelled < len(reduced) and stack[-1].swapcase() == reduced[cancelled]:
+        stack.pop()
+        cancelled += 1
+
+    stack.extend(reduced[cancelled:])
+    return stack
+
+
+def reduce_polymer_parallel(polymer, chunks=None, workers=None):
+    """
+    Reduction is associative: a chunk reduces to whatever is left over, and leftovers combine at their seams.
+    Split the polymer into chunks and reduce them in worker processes; the merge only touches the seams, so
+    it runs locally by cancelling each leftover into a single stack.
+    """
+    if not polymer:
+        return ''
+
+    chunks = chunks or workers or os.cpu_count()
+    chunk_size = -(-len(polymer) // chunks)
+
+    pieces = [polymer[i:i + chunk_size] for i in range(0, len(polymer), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(reduce_polymer, pieces)
+
+    stack = list()
+    for part in parts:
+        cancel_into(stack, part)
+
+    return ''.join(stack)
+
+
+def reduce_polymer_stream(path, block_size=1 << 16):
+    """
+    Reduce a polymer from a file without loading the whole thing; only one block of input is held at a time,
+    alongside the reduced result so far. The result is kept as a stack and joined once at the end, so each
+    block costs only its own length plus whatever it cancels.
+    """
+    stack = list()
+
+    with open(path) as f:
+        for block in iter(lambda: f.read(block_size), ''):
+            cancel_into(stack, reduce_polymer(block.strip()))
+
+    return ''.join(stack)
+
+
+def _length_without_unit(polymer, unit):
+    filtered = polymer.replace(unit, '').replace(unit.upper(), '')
+    return unit, len(reduce_polymer(filtered))
+
+
+def unit_removal_lengths(polymer, workers=None):
+    """
+    Remove each unit type (both polarities) from the polymer and react what's left. Returns a table of
+    {unit_type: reduced_length}, one entry per lowercase letter.
+
+    Removing a unit type commutes with reduction -- anything that reacted in the full polymer still reacts
+    once a type is stripped out -- so every trial can start from the already reduced polymer, which is much
+    shorter than the raw input. The 26 trials are independent, so they run in a process pool.
+    """
+    reduced = reduce_polymer(polymer)
+    units = string.ascii_lowercase
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_length_without_unit, [reduced] * len(units), units))
+
+
 class TestPolymer(unittest.TestCase):
 
     def test_reduce_polymer(self):
         assert reduce_polymer('hHsSmMHhhHwWfoo') == 'foo'
         assert reduce_polymer('hHsSmMHhhHwWfoohHsSmMHaAhhHwW') == 'foo'
 
+    def test_cancel_into(self):
+        assert ''.join(cancel_into(list('fooAb'), 'BaBar')) == 'fooBar'
+        assert cancel_into(list('ab'), 'BA') == []
+        assert ''.join(cancel_into([], 'abc')) == 'abc'
+
+    def test_reduce_polymer_parallel(self):
+        polymer = 'dabAcCaCBAcCcaDA'
+        for chunks in range(1, len(polymer) + 1):
+            assert reduce_polymer_parallel(polymer, chunks=chunks, workers=2) == reduce_polymer(polymer)
+
+        assert reduce_polymer_parallel(data, chunks=7) == reduce_polymer(data)
+
+    def test_reduce_polymer_stream(self):
+        assert reduce_polymer_stream("input/day_05.txt", block_size=1000) == reduce_polymer(data)
+
     def test_part_1(self):
         print("Part 1:", len(reduce_polymer(data)))
 
+    def test_unit_removal_lengths(self):
+        lengths = unit_removal_lengths('dabAcCaCBAcCcaDA')
+        assert len(lengths) == 26
+        assert lengths['a'] == 6
+        assert lengths['b'] == 8
+        assert lengths['c'] == 4
+        assert lengths['d'] == 6
+        assert lengths['z'] == 10
+
     def test_part_2(self):
-        shortest = float('inf')
-        for c in string.ascii_letters:
-            filtered = data.replace(c, '').replace(c.swapcase(), '')
-            shortest = min(
-                len(reduce_polymer(polymer=filtered)),
-                shortest
-            )
-
-        print("Part 2:", shortest)
+        print("Part 2:", min(unit_removal_lengths(data).values()))
 
 
 
@@ -1,5 +1,5 @@
 import numpy as np
-from collections import deque
+import unittest
 
 
 lines = [line.strip().split(",") for line in open("input/day_06.txt").readlines()]
@@ -37,67 +37,123 @@ def make_groups():
     return group_list
 
 
-def mark_grid(size, groups):
+MAX_GRID_CELLS = 1 << 22  # working cells per tile; bigger grids get processed a tile at a time
+
+
+def bounding_box(groups, margin=0):
+    """
+    The (x0, y0, x1, y1) box, inclusive, around every group, grown by margin on each side.
     """
+    xs = [group.x for group in groups]
+    ys = [group.y for group in groups]
+    return min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin
+
+
+def smallest_dtype(max_value):
+    for dtype in (np.int16, np.int32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
 
-    :param size:
-    :param groups:
-    :return:
+    return np.int64
+
+
+def tiles(box, max_cells=MAX_GRID_CELLS):
+    """
+    Split a box into square-ish tiles of at most max_cells cells. A box that fits is its own single tile.
     """
-    grid = (np.ones((size, size, 2)) * -1).astype(int)  # grid is [x][y](i, dist)
+    x0, y0, x1, y1 = box
+    side = max(1, int(max_cells ** 0.5))
 
-    seen = set()
-    queue = deque()
+    if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_cells:
+        yield box
+        return
+
+    for tx in range(x0, x1 + 1, side):
+        for ty in range(y0, y1 + 1, side):
+            yield tx, ty, min(tx + side - 1, x1), min(ty + side - 1, y1)
 
-    for group in groups:
-        cell = (group.x, group.y, group.i, 0)
-        queue.append(cell)
-        seen.add((group.x, group.y, group.i))
 
-    while queue:
-        x, y, i, dist = queue.pop()
+def mark_grid(groups, box=None, chunk=16):
+    """
+    Label every cell of the box (the groups' bounding box by default) with the index of its closest group, or -1
+    where two or more groups tie. The grid is indexed [x - x0][y - y0].
 
-        if x < 0 or y < 0 or x > size - 1 or y > size - 1:
-            continue
+    Distances to every group are computed at once with broadcasting, a chunk of groups at a time. The
+    (chunk, width, height) distance block and its tie mask are chunk times the size of the box, so callers
+    with a memory budget should size the box to match. Each chunk's argmin is folded into the running best; a
+    cell is a tie if its minimum shows up twice inside a chunk or matches the best from an earlier chunk.
+    """
+    x0, y0, x1, y1 = box or bounding_box(groups)
+    gx0, gy0, gx1, gy1 = bounding_box(groups)
+    # one past the largest distance, which is left free as the "no group seen yet" sentinel
+    dtype = smallest_dtype(max(x1 - gx0, gx1 - x0) + max(y1 - gy0, gy1 - y0) + 1)
+    label_dtype = smallest_dtype(len(groups))
 
-        _, prev_dist = grid[x][y]  # the previous values in the cell
+    # work relative to the box's corner so coordinates stay as small as the distances
+    xs = np.array([group.x - x0 for group in groups], dtype=dtype)
+    ys = np.array([group.y - y0 for group in groups], dtype=dtype)
+    grid_x = np.arange(x1 - x0 + 1, dtype=dtype)[:, None]
+    grid_y = np.arange(y1 - y0 + 1, dtype=dtype)[None, :]
 
-        if dist < prev_dist or prev_dist == -1:  # -1 is an uninitialized cell
-            grid[x][y] = (i, dist)
-        elif dist == prev_dist:
-            grid[x][y] = (i, dist)
-        else:
-            continue
+    best = np.full((x1 - x0 + 1, y1 - y0 + 1), np.iinfo(dtype).max, dtype=dtype)
+    grid = np.full(best.shape, -1, dtype=label_dtype)
 
-        for neighbor in neighbors(x, y):
-            if (*neighbor, i) not in seen:
-                queue.appendleft((*neighbor, i, dist + 1))
-                seen.add((*neighbor, i))
+    for start in range(0, len(groups), chunk):
+        px = xs[start:start + chunk, None, None]
+        py = ys[start:start + chunk, None, None]
+        dist = np.abs(grid_x - px) + np.abs(grid_y - py)
 
-    return grid
+        chunk_best = dist.min(axis=0)
+        chunk_label = dist.argmin(axis=0).astype(label_dtype) + start
+        chunk_label[(dist == chunk_best).sum(axis=0) > 1] = -1
 
+        grid = np.where(chunk_best < best, chunk_label, np.where(chunk_best == best, -1, grid))
+        best = np.minimum(best, chunk_best)
 
-def neighbors(x, y):
-    return (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)
+    return grid
 
 
-def biggest_non_inf_group(groups, grid, size):
+def border_labels(grid, tile, box):
+    """
+    Every group that owns a cell on the edge of the bounding box keeps going forever in that direction. Only
+    the sides of the tile that lie on the box's edge count.
     """
-    Go through the grid, count the size of each group, and mark which ones are touching the edge and will thus
-    expand infinitely. Sort the non-infinite groups by size and return the biggest one.
+    edges = [
+        edge for edge, on_border in (
+            (grid[0], tile[0] == box[0]),
+            (grid[-1], tile[2] == box[2]),
+            (grid[:, 0], tile[1] == box[1]),
+            (grid[:, -1], tile[3] == box[3]),
+        ) if on_border
+    ]
+
+    if not edges:
+        return set()
+
+    edges = np.concatenate(edges)
+    return set(np.unique(edges[edges >= 0]).tolist())
+
+
+def biggest_non_inf_group(groups, max_cells=MAX_GRID_CELLS, chunk=16):
     """
-    for x in range(size):
-        for y in range(size):
-            i, dist = grid[x][y]
+    Label the groups' bounding box, count the size of each group, and mark which ones are touching the edge and
+    will thus expand infinitely. Sort the non-infinite groups by size and return the biggest one.
 
-            if i == 10e6:  # this is the default value; the cell was never visited
-                continue
+    Labeling a tile holds a (chunk, width, height) distance block, so tiles are cut to max_cells // chunk cells
+    and at most max_cells distances are ever in memory at once.
+    """
+    box = bounding_box(groups)
+    counts = np.zeros(len(groups), dtype=np.int64)
+    infinite = set()
 
-            group = groups[i]
-            group.cell_count += 1
+    for tile in tiles(box, max(1, max_cells // chunk)):
+        grid = mark_grid(groups, tile, chunk)
+        counts += np.bincount(grid[grid >= 0], minlength=len(groups))
+        infinite |= border_labels(grid, tile, box)
 
-            if x == 0 or y == 0 or x == size - 1 or y == size - 1:
-                group.is_infinite = True
+    for group in groups:
+        group.cell_count = int(counts[group.i])
+        group.is_infinite = group.i in infinite
 
     non_inf_groups = [group for group in groups if not group.is_infinite]
     non_inf_groups.sort(key=lambda g: g.cell_count)
@@ -105,54 +161,123 @@ def biggest_non_inf_group(groups, grid, size):
     return non_inf_groups[-1]
 
 
-def most_central_region(groups, size=400):
-    avg_x = sum([group.x for group in groups]) // len(groups)
-    avg_y = sum([group.y for group in groups]) // len(groups)
-    central_cells = []
+def axis_costs(coords, lo, hi):
+    """
+    Sum of |t - c| over every coordinate c, for each integer t in [lo, hi]. With the coordinates sorted, the
+    ones at or left of t contribute t * k - prefix[k] and the rest contribute (total - prefix[k]) - t * (n - k).
+    """
+    coords = np.sort(np.asarray(coords, dtype=np.int64))
+    prefix = np.concatenate(([0], np.cumsum(coords)))
+    t = np.arange(lo, hi + 1, dtype=np.int64)
+    k = np.searchsorted(coords, t, side='right')
 
-    seen = {(avg_x, avg_y)}
-    queue = deque([(avg_x, avg_y)])
+    return t * k - prefix[k] + (prefix[-1] - prefix[k]) - t * (len(coords) - k)
 
-    while queue:
-        x, y = queue.pop()
 
-        if x < 0 or y < 0 or x > size - 1 or y > size - 1:
-            continue
+def axis_cost_pair(groups, threshold):
+    """
+    Manhattan distance sums separate by axis, so the total distance from (x, y) to every group is
+    cost_x[x] + cost_y[y]. Outside the bounding box every step adds len(groups) to the total, so nothing more
+    than threshold // len(groups) cells past the box can be under the threshold.
 
-        if not is_within_dist_of_all(x, y, groups):
-            continue
+    Returns both cost arrays, in the smallest dtype that holds their sum, and the box they cover.
+    """
+    box = x0, y0, x1, y1 = bounding_box(groups, margin=threshold // len(groups) + 1)
+    cost_x = axis_costs([group.x for group in groups], x0, x1)
+    cost_y = axis_costs([group.y for group in groups], y0, y1)
+    dtype = smallest_dtype(int(cost_x.max() + cost_y.max()))
 
-        central_cells.append((x, y))
+    return cost_x.astype(dtype), cost_y.astype(dtype), box
 
-        for point in neighbors(x, y):
-            if point not in seen:
-                queue.append(point)
-                seen.add(point)
 
-    return len(central_cells)
+def total_distance_field(groups, threshold):
+    """
+    The dense total-distance field, indexed [x - x0][y - y0], and the (x0, y0) of its [0][0] cell.
+    """
+    cost_x, cost_y, (x0, y0, _, _) = axis_cost_pair(groups, threshold)
+    return cost_x[:, None] + cost_y[None, :], (x0, y0)
 
 
-def distance(x1, y1, x2, y2):
-    return abs(x1 - x2) + abs(y1 - y2)
+def most_central_region(groups, threshold=10000, max_cells=MAX_GRID_CELLS):
+    """
+    Count the cells whose total distance to every group is less than the threshold. The total distance is a sum
+    of convex functions, so those cells always form a single region. The field is only ever built a tile at a
+    time.
+    """
+    cost_x, cost_y, box = axis_cost_pair(groups, threshold)
+    x0, y0, _, _ = box
+    count = 0
 
+    for tx0, ty0, tx1, ty1 in tiles(box, max_cells):
+        tile = cost_x[tx0 - x0:tx1 - x0 + 1, None] + cost_y[None, ty0 - y0:ty1 - y0 + 1]
+        count += int(np.count_nonzero(tile < threshold))
 
-def is_within_dist_of_all(x, y, groups):
-    return sum([distance(x, y, group.x, group.y) for group in groups]) < 10000
+    return count
 
 
 def main():
     """
-    We're overloading numpy a bit here; the cells will contain [distance, point_id] where distance is the
-    Taxi / Manhattan distance, and point_id is the integer ID of the point, or -1 if there is a tie.
+    The grid cells contain the integer ID of the closest point by Taxi / Manhattan distance, or -1 if there
+    is a tie.
     """
     groups = make_groups()
-    size = 400
 
-    grid = mark_grid(size, groups)
+    print("Part 1:", biggest_non_inf_group(groups).cell_count)
+
+    print("Part 2:", most_central_region(groups))
+
+
+class TestCoordinates(unittest.TestCase):
+
+    example = [(1, 1), (1, 6), (8, 3), (3, 4), (5, 5), (8, 9)]
+
+    def example_groups(self):
+        return [Group(x=x, y=y, i=i) for i, (x, y) in enumerate(self.example)]
+
+    def test_mark_grid(self):
+        grid = mark_grid(self.example_groups(), box=(0, 0, 9, 9), chunk=4)
+        assert grid[5][0] == -1  # equally far from A and C
+        assert grid[4][3] == 3
+        assert grid[8][9] == 5
+
+        x0, y0, _, _ = bounding_box(self.example_groups())
+        assert mark_grid(self.example_groups())[4 - x0][3 - y0] == 3
+
+    def test_mark_grid_sentinel(self):
+        # the far cell is exactly int16's max away and must not tie with the unvisited sentinel
+        grid = mark_grid([Group(x=0, y=0, i=0)], box=(0, 0, np.iinfo(np.int16).max, 0))
+        assert (grid == 0).all()
+
+    def test_biggest_non_inf_group(self):
+        for max_cells in (MAX_GRID_CELLS, 9, 1):
+            groups = self.example_groups()
+            biggest = biggest_non_inf_group(groups, max_cells=max_cells)
+            assert (biggest.i, biggest.cell_count) == (4, 17)
+            assert {g.i for g in groups if g.is_infinite} == {0, 1, 2, 5}
+            assert groups[3].cell_count == 9
+
+    def test_unbounded_plane(self):
+        groups = [Group(x=x * 100 - 40000, y=y * 100 + 70000, i=i) for i, (x, y) in enumerate(self.example)]
+        assert biggest_non_inf_group(groups).i == 4
+        assert biggest_non_inf_group(groups, max_cells=10 ** 4).i == 4
+        assert most_central_region(groups, threshold=32) == 0
+        assert most_central_region(groups, threshold=3200) == most_central_region(groups, 3200, max_cells=10 ** 3) > 0
+
+    def test_smallest_dtype(self):
+        assert smallest_dtype(400) == np.int16
+        assert smallest_dtype(40000) == np.int32
+        assert smallest_dtype(1 << 40) == np.int64
 
-    # print("Part 1:", biggest_non_inf_group(groups, grid, size))
+    def test_axis_costs(self):
+        coords = [1, 1, 8, 3, 5, 8]
+        assert axis_costs(coords, -2, 12).tolist() == [sum(abs(t - c) for c in coords) for t in range(-2, 13)]
 
-    # print("Part 2:", most_central_region(groups))
+    def test_most_central_region(self):
+        groups = self.example_groups()
+        field, (x0, y0) = total_distance_field(groups, 32)
+        assert field[4 - x0][3 - y0] == 30
+        assert most_central_region(groups, threshold=32) == 16
+        assert most_central_region(groups, threshold=32, max_cells=4) == 16
 
 
 if __name__ == '__main__':
@@ -1,11 +1,15 @@
 import re
 import heapq
 import unittest
+from unittest.mock import patch
+import numpy as np
 from string import ascii_uppercase
-from collections import defaultdict, deque
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 
 
-log_parser = re.compile(" (.) .+ (.) ")
+log_parser = re.compile(r"Step (\S+) must be finished before step (\S+) can begin")
 pairs = [log_parser.search(line.strip()).groups() for line in open("input/day_07.txt").readlines()]
 
 
@@ -20,6 +24,10 @@ def make_graph():
     return graph
 
 
+def letter_cost(name):
+    return ascii_uppercase.find(name) + 1 + BASE_COST
+
+
 class Graph:
 
     class Node:
@@ -46,7 +54,7 @@ class Graph:
 
         @property
         def cost(self):
-            return ascii_uppercase.find(self.data) + 1 + BASE_COST
+            return letter_cost(self.data)
 
     def __init__(self):
         self.nodes = defaultdict(Graph.Node)
@@ -68,82 +76,212 @@ class Graph:
         node_b.indegree += 1
 
 
-class Worker:
-    def __init__(self):
-        self.job = None
-        self.remaining_cost = 0
+def time_with_workers(graph, num_workers=5):
+    """
+    Event-driven simulation: rather than ticking one second at a time, jump straight to the next moment a job
+    finishes. Jobs in flight live in a min-heap of (finish_time, node), and jobs become ready once their
+    indegree counter hits zero, so the whole run is O((V + E) log V) regardless of how big BASE_COST is.
+
+    Every job that finishes at the same second is retired before idle workers pick up new jobs, so they always
+    take the alphabetically first ready ones. The graph's own indegrees are left untouched.
+    """
+    indegree = {node: node.indegree for node in graph.nodes.values()}
+    ready = sorted(node for node, count in indegree.items() if count == 0)
+    in_progress = []
+    total_seconds = 0
+
+    while ready or in_progress:
+        while ready and len(in_progress) < num_workers:
+            job = heapq.heappop(ready)
+            heapq.heappush(in_progress, (total_seconds + job.cost, job))
+
+        total_seconds = in_progress[0][0]
+
+        while in_progress and in_progress[0][0] == total_seconds:
+            _, job = heapq.heappop(in_progress)
+
+            for child in job.children:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    heapq.heappush(ready, child)
+
+    return total_seconds
 
-    def __repr__(self):
-        if not self.job:
-            return " . "
-        return f" {self.job.data} "
+
+class CompactGraph:
+    """
+    Array-backed graph for dependency graphs far too big for a Node per step. Step names are interned to ints
+    in sorted order, so comparing ids is the same as comparing names, and edges are stored in CSR form: the
+    children of node i are targets[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, names, offsets, targets, costs):
+        self.names = names
+        self.offsets = offsets
+        self.targets = targets
+        self.costs = costs
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_pairs(cls, edges, costs=None):
+        """
+        Build from (before, after) name pairs. costs maps names to durations; without it every step is priced
+        by letter_cost, which only knows single uppercase letters, so any other name is a ValueError.
+        """
+        edges = list(edges)
+        names = sorted({name for edge in edges for name in edge})
+
+        if costs is None:
+            unpriced = [name for name in names if len(name) != 1 or name not in ascii_uppercase]
+            if unpriced:
+                raise ValueError(f"No cost mapping given for steps that aren't single letters: {unpriced[:5]}")
+        ids = {name: i for i, name in enumerate(names)}
+
+        sources = np.fromiter((ids[a] for a, _ in edges), dtype=np.int64, count=len(edges))
+        targets = np.fromiter((ids[b] for _, b in edges), dtype=np.int64, count=len(edges))
+        keys = np.unique(sources * len(names) + targets)  # sorted by source, and duplicate edges dropped
+        sources, targets = np.divmod(keys, len(names))
+
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(names)), out=offsets[1:])
+
+        cost_of = costs.__getitem__ if costs is not None else letter_cost
+        node_costs = np.fromiter((cost_of(name) for name in names), dtype=np.int64, count=len(names))
+
+        return cls(names, offsets, targets, node_costs)
 
     @property
-    def free(self):
-        return not self.job or self.remaining_cost == 0
+    def indegree(self):
+        return np.bincount(self.targets, minlength=len(self))
 
-    def set_job(self, job):
-        self.job = job
-        if job:
-            self.remaining_cost = job.cost
+    def children(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
 
-    def work(self):
-        if self.job and self.remaining_cost > 0:
-            self.remaining_cost -= 1
 
+def find_compact_order(graph):
+    """
+    Kahn's algorithm over the CSR arrays. Ties go to the smallest id, which is the alphabetically first name,
+    matching find_graph_order. Returns the order as an array of node ids, or raises ValueError if the steps
+    depend on each other in a cycle.
+    """
+    indegree = graph.indegree
+    ready = np.flatnonzero(indegree == 0).tolist()
+    order = np.empty(len(graph), dtype=np.int64)
 
-def time_with_workers(graph, num_workers=5):
-    workers = [Worker() for _ in range(num_workers)]
-    work_queue = deque(list(find_graph_order(graph)))  # todo: after a refactor I don't think this needs to be a deque
+    for i in range(len(graph)):
+        if not ready:
+            raise ValueError("dependency cycle")
+
+        node = heapq.heappop(ready)
+        order[i] = node
+
+        children = graph.children(node)
+        indegree[children] -= 1
+        for child in children[indegree[children] == 0].tolist():
+            heapq.heappush(ready, child)
+
+    return order
+
+
+def compact_time_with_workers(graph, num_workers=5, indegree=None):
+    """
+    time_with_workers for a CompactGraph, with the same event-driven simulation and alphabetical tie-breaks.
+    Pass a precomputed indegree array to skip recounting it; it's copied, not consumed. Raises ValueError on a
+    dependency cycle.
+    """
+    indegree = graph.indegree if indegree is None else indegree.copy()
+    costs = graph.costs.tolist()
+    ready = np.flatnonzero(indegree == 0).tolist()
+    in_progress = []
     total_seconds = 0
-    done = set()  # used for debug drawing
-    in_progress = set()
+    remaining = len(graph)
 
-    def work():
-        for worker in workers:
+    while ready or in_progress:
+        while ready and len(in_progress) < num_workers:
+            job = heapq.heappop(ready)
+            heapq.heappush(in_progress, (total_seconds + costs[job], job))
 
-            if not worker.free:
-                worker.work()
+        total_seconds = in_progress[0][0]
 
-            elif worker.free:
+        while in_progress and in_progress[0][0] == total_seconds:
+            _, job = heapq.heappop(in_progress)
+            remaining -= 1
 
-                if worker.job and worker.job in in_progress:
-                    in_progress.remove(worker.job)
-                    done.add(worker.job)
+            children = graph.children(job)
+            indegree[children] -= 1
+            for child in children[indegree[children] == 0].tolist():
+                heapq.heappush(ready, child)
 
-                new_job = next_job()
-                if new_job:
-                    in_progress.add(new_job)
+    if remaining:
+        raise ValueError("dependency cycle")
 
-                worker.set_job(new_job)
-                worker.work()  # do one round of work immediately on the new job
+    return total_seconds
 
-    def next_job():
-        if not work_queue:
-            return None
 
-        seen = set()
-        for potential_job in work_queue:
-            seen.add(potential_job)
-            if node_is_ready(potential_job, blockers=seen | in_progress):
-                work_queue.remove(potential_job)
-                return potential_job
+def critical_path(graph, order=None):
+    """
+    The longest chain of step costs through the graph; no number of workers can finish sooner than this.
+    Walks the nodes in topological order pushing each node's finish time onto its children's start times.
+    """
+    if not len(graph):
+        return 0
 
-        return None
+    order = find_compact_order(graph) if order is None else order
+    start = np.zeros(len(graph), dtype=np.int64)
 
-    def node_is_ready(potential_job, blockers):
-        for node in blockers:
-            if potential_job in node.children:
-                return False
-        return True
+    for node in order.tolist():
+        children = graph.children(node)
+        start[children] = np.maximum(start[children], start[node] + graph.costs[node])
 
-    work()  # example has one round of work before the 0th second. I think this is causing an off-by-one for me.
+    return int((start + graph.costs).max())
 
-    while work_queue or in_progress:
-        work()
-        total_seconds += 1
 
-    return total_seconds
+@dataclass
+class WorkerSweep:
+    critical_path: int
+    total_work: int
+    makespans: dict  # num_workers -> seconds
+
+    def lower_bound(self, num_workers):
+        return max(self.critical_path, -(-self.total_work // num_workers))
+
+    def fewest_workers_for(self, seconds):
+        fitting = [workers for workers, makespan in self.makespans.items() if makespan <= seconds]
+        return min(fitting) if fitting else None
+
+
+_sweep_graph = None
+_sweep_indegree = None
+
+
+def _start_sweep_process(graph, indegree):
+    global _sweep_graph, _sweep_indegree
+    _sweep_graph, _sweep_indegree = graph, indegree
+
+
+def _sweep_makespan(num_workers):
+    return compact_time_with_workers(_sweep_graph, num_workers, indegree=_sweep_indegree)
+
+
+def sweep_workers(graph, max_workers, processes=None):
+    """
+    Simulate every worker count from 1 to max_workers. The runs are independent, so they go to a process pool.
+    The indegrees are counted once, and they and the graph are handed to each pool process when it starts, so
+    the arrays are sent once per process rather than once per worker count.
+    """
+    counts = range(1, max_workers + 1)
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_start_sweep_process,
+                             initargs=(graph, graph.indegree)) as pool:
+        makespans = dict(zip(counts, pool.map(_sweep_makespan, counts)))
+
+    return WorkerSweep(
+        critical_path=critical_path(graph),
+        total_work=int(graph.costs.sum()),
+        makespans=makespans,
+    )
 
 
 def simple_graph():
@@ -185,11 +323,67 @@ class TestGraph(unittest.TestCase):
         assert ''.join([node.data for node in order]) == 'CABDFE'
 
     def test_time_with_workers(self):
-        global BASE_COST
-        BASE_COST = 0
-        time = time_with_workers(self.graph, 2)
-        if time != 15:
-            raise Exception(f"Expected 15, got {time}")
+        with patch(f"{__name__}.BASE_COST", 0):
+            time = time_with_workers(self.graph, 2)
+            if time != 15:
+                raise Exception(f"Expected 15, got {time}")
+
+        with patch(f"{__name__}.BASE_COST", 10 ** 9):
+            assert time_with_workers(self.graph, 2) == 4 * 10 ** 9 + 18
+
+    def test_time_with_workers_leaves_graph_intact(self):
+        time_with_workers(self.graph, 2)
+        assert ''.join([node.data for node in find_graph_order(self.graph)]) == 'CABDFE'
+
+    def test_compact_graph(self):
+        edges = [("C", "A"), ("C", "F"), ("A", "B"), ("A", "D"), ("B", "E"), ("D", "E"), ("F", "E"), ("C", "A")]
+        graph = CompactGraph.from_pairs(edges, costs={name: i + 1 for i, name in enumerate(ascii_uppercase)})
+        assert graph.names == ["A", "B", "C", "D", "E", "F"]
+        assert graph.indegree.tolist() == [1, 1, 0, 1, 3, 1]
+        assert ''.join(graph.names[i] for i in find_compact_order(graph)) == 'CABDFE'
+        assert compact_time_with_workers(graph, 2) == 15
+
+    def test_compact_graph_needs_costs_for_long_names(self):
+        with self.assertRaises(ValueError):
+            CompactGraph.from_pairs([("AB", "XY"), ("build", "ship")])
+
+        assert CompactGraph.from_pairs([("A", "Z")]).costs.tolist() == [1 + BASE_COST, 26 + BASE_COST]
+
+    def test_compact_graph_cycle(self):
+        graph = CompactGraph.from_pairs([("A", "B"), ("B", "C"), ("C", "B")])
+        with self.assertRaises(ValueError):
+            find_compact_order(graph)
+        with self.assertRaises(ValueError):
+            critical_path(graph)
+        with self.assertRaises(ValueError):
+            compact_time_with_workers(graph)
+
+        assert critical_path(CompactGraph.from_pairs([])) == 0
+
+    def test_compact_graph_multi_letter_names(self):
+        edges = [("build-core", "test-core"), ("build-core", "build-ui"), ("build-ui", "ship"), ("test-core", "ship")]
+        costs = {"build-core": 10, "test-core": 30, "build-ui": 5, "ship": 1}
+        graph = CompactGraph.from_pairs(edges, costs=costs)
+        assert [graph.names[i] for i in find_compact_order(graph)] == ["build-core", "build-ui", "test-core", "ship"]
+        assert compact_time_with_workers(graph, 1) == 46
+        assert compact_time_with_workers(graph, 2) == 41
+
+    def test_compact_matches_graph(self):
+        graph = CompactGraph.from_pairs(pairs)
+        order = ''.join(node.data for node in find_graph_order(make_graph()))
+        assert ''.join(graph.names[i] for i in find_compact_order(graph)) == order
+        assert compact_time_with_workers(graph) == time_with_workers(make_graph())
+
+    def test_sweep_workers(self):
+        edges = [("C", "A"), ("C", "F"), ("A", "B"), ("A", "D"), ("B", "E"), ("D", "E"), ("F", "E")]
+        graph = CompactGraph.from_pairs(edges, costs={name: i + 1 for i, name in enumerate(ascii_uppercase)})
+        sweep = sweep_workers(graph, 4, processes=2)
+        assert sweep.critical_path == 3 + 6 + 5
+        assert sweep.total_work == 21
+        assert sweep.makespans == {1: 21, 2: 15, 3: 14, 4: 14}
+        assert all(sweep.makespans[k] >= sweep.lower_bound(k) for k in sweep.makespans)
+        assert sweep.fewest_workers_for(14) == 3
+        assert sweep.fewest_workers_for(13) is None
 
     def test_part_1(self):
         print("Part 1:", ''.join([node.data for node in find_graph_order(make_graph())]))
@@ -1,4 +1,5 @@
 from collections import deque, namedtuple
+import numpy as np
 import unittest
 import string
 
@@ -24,55 +25,110 @@ class Tree:
 
     class Node:
 
-        def __init__(self, data=None):
+        def __init__(self, data=None, node_id=None, tree=None):
             self.data = data
+            self.id = node_id
+            self.tree = tree
             self.children = list()
             self.metadata = None
 
         def __repr__(self):
             return f"Node({self.data})"
 
+        @property
+        def children(self):
+            return self._children
+
+        @children.setter
+        def children(self, children):
+            self._children = children
+            self._changed()
+
+        @property
+        def metadata(self):
+            return self._metadata
+
+        @metadata.setter
+        def metadata(self, metadata):
+            self._metadata = metadata
+            self._changed()
+
+        def _changed(self):
+            if self.tree is not None:
+                self.tree._values = None
+
         @property
         def value(self):
+            if self.tree is not None:
+                return self.tree.values[self.id]
+
+            return self.value_from([child.value for child in self.children])
+
+        def value_from(self, child_values):
+            """
+            This node's value, given its children's values in order.
+            """
             if not self.children:
                 return sum(self.metadata)
 
             total = 0
             for num in self.metadata:
-                if num - 1 >= len(self.children):  # -1 because this is 1 indexed, but python is 0 indexed
+                if num - 1 >= len(self.children) or num < 1:  # -1 because this is 1 indexed, but python is 0 indexed
                     continue
 
-                total += self.children[num - 1].value
+                total += child_values[num - 1]
 
             return total
 
     def __init__(self, root=None):
         self.root = root
         self.count = 0
+        self._values = None
 
     def new_node(self):
-        node = Tree.Node(num_to_letter(self.count))
+        node = Tree.Node(num_to_letter(self.count), node_id=self.count, tree=self)
         self.count += 1
+        self._values = None
         return node
 
+    @property
+    def values(self):
+        """
+        Every node's value in a flat list indexed by node id, worked out bottom-up in a single post-order pass so
+        that a subtree referenced by several metadata entries is only ever evaluated once. It's a list rather
+        than an int64 array because values can grow geometrically with depth.
+
+        The list is cached until a node is added or a node's metadata or children are reassigned. Editing those
+        lists in place after values have been read isn't noticed, so assign a new list instead.
+        """
+        if self._values is None:
+            values = [0] * self.count
+            for node in self.all_nodes():
+                values[node.id] = node.value_from([values[child.id] for child in node.children])
+
+            self._values = values
+
+        return self._values
+
     def all_nodes(self):
+        """
+        Post-order traversal, children before their parent.
+        """
         if not self.root:
-            return None
-
-        if not self.root.children:
-            return self.root
+            return
 
-        nodes = []  # todo: this should be a generator, yield syntax wasn't working quite right though
+        stack = [(self.root, False)]
 
-        def visit(node):
-            for child in node.children:
-                visit(child)
+        while stack:
+            node, expanded = stack.pop()
 
-            nodes.append(node)
+            if expanded:
+                yield node
+                continue
 
-        visit(self.root)
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
 
-        return nodes
 
     def metadata_sum(self):
         return sum([sum(node.metadata) for node in self.all_nodes()])
@@ -117,11 +173,61 @@ class Tree:
         return tree
 
 
+def parse_license(license_input):
+    return np.array(license_input.split(), dtype=np.int64)
+
+
+def license_checksums(numbers):
+    """
+    Walk the license numbers once and return (metadata_sum, root_value) without building a Tree.
+
+    Works over a list, a NumPy int array or a memoryview of ints. Instead of recursing, each open node is a
+    frame on an explicit stack holding [children_left, num_metadata, child_values]; a node's metadata is read
+    once its last child is done, and its value is handed to the frame below it. Deep trees can't hit the
+    recursion limit.
+    """
+    try:
+        numbers = memoryview(numbers)  # plain ints on indexing, rather than NumPy scalars
+    except TypeError:
+        pass
+
+    metadata_sum = 0
+    stack = [[numbers[0], numbers[1], []]]
+    position = 2
+    value = 0
+
+    while stack:
+        frame = stack[-1]
+        children_left, num_metadata, child_values = frame
+
+        if children_left:
+            frame[0] -= 1
+            stack.append([numbers[position], numbers[position + 1], []])
+            position += 2
+            continue
+
+        metadata = numbers[position:position + num_metadata]
+        position += num_metadata
+        total = sum(metadata)
+        metadata_sum += total
+
+        if child_values:
+            value = sum(child_values[num - 1] for num in metadata if 0 < num <= len(child_values))
+        else:
+            value = total
+
+        stack.pop()
+        if stack:
+            stack[-1][2].append(value)
+
+    return metadata_sum, value
+
+
 def main():
-    tree = Tree.tree_from_headers(license_file)
+    metadata_sum, root_value = license_checksums(parse_license(license_file))
 
-    print("Part 1:", tree.metadata_sum())
-    print("Part 2:", tree.root.value)
+    print("Part 1:", metadata_sum)
+    print("Part 2:", root_value)
 
 
 if __name__ == '__main__':
@@ -145,6 +251,51 @@ class TestTree(unittest.TestCase):
         print(self.tree.root.value)
         assert self.tree.root.value == 66
 
+    def test_all_nodes(self):
+        assert [node.data for node in self.tree.all_nodes()] == ['B', 'D', 'C', 'A']
+        assert [node.data for node in Tree(Tree.Node('A')).all_nodes()] == ['A']
+
+    def test_values_are_shared(self):
+        assert self.tree.values == [66, 33, 0, 99]
+
+        # every node points at its only child ten times; without memoization that's 10 ** depth evaluations
+        tree = Tree()
+        tree.root = node = tree.new_node()
+        for _ in range(60):
+            node.metadata = [1] * 10
+            node.children.append(tree.new_node())
+            node = node.children[0]
+
+        node.metadata = [1]
+        assert tree.root.value == 10 ** 60
+
+    def test_values_follow_changes(self):
+        assert self.tree.root.value == 66
+
+        b, c = self.tree.root.children
+        b.metadata = [1, 2]
+        assert self.tree.root.value == 6
+
+        c.metadata = [1]
+        assert self.tree.root.value == 105
+
+        self.tree.root.children = [c, b]
+        assert self.tree.root.value == 201
+
+    def test_license_checksums(self):
+        numbers = parse_license(self.sampleInput)
+        assert license_checksums(numbers) == (138, 66)
+        assert license_checksums(numbers.tolist()) == (138, 66)
+        assert license_checksums(memoryview(numbers)) == (138, 66)
+
+        tree = Tree.tree_from_headers(license_file)
+        assert license_checksums(parse_license(license_file)) == (tree.metadata_sum(), tree.root.value)
+
+    def test_license_checksums_deep_tree(self):
+        depth = 100000
+        numbers = [1, 1] * depth + [0, 1, 7] + [1] * depth
+        assert license_checksums(np.array(numbers)) == (depth + 7, 7)
+
 
 """
 --- Day 8: Memory Maneuver ---
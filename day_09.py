@@ -1,4 +1,6 @@
+from array import array
 from collections import deque, defaultdict
+from itertools import islice
 import unittest
 
 
@@ -19,10 +21,58 @@ class MarbleGame:
     def done(self):
         return self.marble >= self.last_marble
 
-    def play(self):
+    def play(self, blocks=False):
+        if blocks:
+            self.play_blocks()
+
         while not self.done:
             self.turn()
 
+    def play_blocks(self):
+        """
+        Fast-forward through whole 23-marble blocks. Read clockwise from just after the current marble, the
+        circle is a queue, and every block does the same thing to it: the first 22 marbles s1..s22 come off the
+        front, [s20, m+20, s21, m+21, s22, m+22] go back on the front behind the new current marble m+19, and
+        [current, s1, m+1, ..., s18, m+18] go on the back. s19 is the marble the scoring turn takes. The queue is
+        a list with a moving head, so a block is a handful of slice operations rather than 23 rotates; the
+        consumed front is cut off whenever it grows past half the list, so the list stays within about twice the
+        size of the circle.
+
+        Plays regular turns until the circle is big enough for the pattern to hold, and stops at the last whole
+        block; self.marbles is rebuilt at the end so play() can finish any leftover turns.
+        """
+        while not self.done and (len(self.marbles) < 23 or self.marble % 23):
+            self.turn()
+
+        current = self.marbles[-1]
+        queue = list(self.marbles)[:-1]
+        head = 0
+        m = self.marble
+
+        while m + 23 <= self.last_marble:
+            taken = queue[head:head + 22]
+
+            back = [0] * 37
+            back[0] = current
+            back[1::2] = taken[:18]
+            back[2::2] = range(m + 1, m + 19)
+            queue.extend(back)
+
+            head += 16
+            queue[head:head + 6] = [taken[19], m + 20, taken[20], m + 21, taken[21], m + 22]
+
+            self.players[(m + 23) % self.num_players] += m + 23 + taken[18]
+            current = m + 19
+            m += 23
+
+            if head > len(queue) // 2:  # drop the consumed front once it's most of the list
+                del queue[:head]
+                head = 0
+
+        self.marbles = deque(islice(queue, head, None))
+        self.marbles.append(current)
+        self.marble = m
+
     def turn(self):
         if self.done:
             raise Exception("Tried to play a done game")
@@ -47,6 +97,110 @@ class MarbleGame:
         return max(self.players.values())
 
 
+class ArrayMarbleGame:
+    """
+    Same game as MarbleGame, but the circle is a doubly linked list held in two preallocated array('i') buffers
+    of next/prev pointers indexed by marble number, and scores go in a fixed array('q') indexed by player. That
+    keeps memory at a few ints per marble with no Python object per marble.
+
+    With skip_ahead, each run of 22 regular turns and the scoring turn after it is done as one splice: the 23
+    marbles clockwise of the current marble are read once, the 22 new marbles are threaded between them, and the
+    one the scoring turn would remove is never linked in.
+    """
+
+    def __init__(self, num_players, last_marble, skip_ahead=True):
+        self.num_players = num_players
+        self.last_marble = last_marble
+        self.skip_ahead = skip_ahead
+
+        self.next = array('i', [0]) * (last_marble + 1)
+        self.prev = array('i', [0]) * (last_marble + 1)
+        self.scores = array('q', [0]) * num_players
+        self.current = 0
+        self.marble = 0
+        self.size = 1
+
+    def __repr__(self):
+        marbles = [0]
+        while self.next[marbles[-1]] != 0:
+            marbles.append(self.next[marbles[-1]])
+
+        return f"ArrayMarbleGame({' '.join([str(m) for m in marbles])})"
+
+    @property
+    def done(self):
+        return self.marble >= self.last_marble
+
+    def play(self):
+        while not self.done:
+            if self.skip_ahead and self.size >= 23 and self.marble % 23 == 0 and self.marble + 23 <= self.last_marble:
+                self.block()
+            else:
+                self.turn()
+
+    def turn(self):
+        if self.done:
+            raise Exception("Tried to play a done game")
+
+        nxt, prev = self.next, self.prev
+        new_marble = self.marble + 1
+
+        if new_marble % 23 == 0:
+            removed = self.current
+            for _ in range(7):
+                removed = prev[removed]
+
+            nxt[prev[removed]] = nxt[removed]
+            prev[nxt[removed]] = prev[removed]
+            self.scores[new_marble % self.num_players] += new_marble + removed
+            self.current = nxt[removed]
+            self.size -= 1
+        else:
+            left = nxt[self.current]
+            right = nxt[left]
+            nxt[left] = new_marble
+            prev[new_marble] = left
+            nxt[new_marble] = right
+            prev[right] = new_marble
+            self.current = new_marble
+            self.size += 1
+
+        self.marble = new_marble
+
+    def block(self):
+        """
+        Play marbles m + 1 through m + 23 at once. Marble m + i lands between the i-th and (i + 1)-th marbles
+        clockwise of the current one, and the scoring marble then takes the 19th of those, leaving m + 19 current.
+        Needs at least 23 marbles in the circle so the 22 marbles read are all distinct.
+        """
+        nxt, prev = self.next, self.prev
+        m = self.marble
+
+        clockwise = [0] * 23
+        marble = self.current
+        for i in range(23):
+            marble = nxt[marble]
+            clockwise[i] = marble
+
+        for i in range(1, 23):
+            new_marble = m + i
+            left = clockwise[i - 1] if i != 19 else m + 18  # the 19th marble is the one taken
+            right = clockwise[i]
+            nxt[left] = new_marble
+            prev[new_marble] = left
+            nxt[new_marble] = right
+            prev[right] = new_marble
+
+        self.scores[(m + 23) % self.num_players] += m + 23 + clockwise[18]
+        self.current = m + 19
+        self.marble = m + 23
+        self.size += 21
+
+    @property
+    def winning_score(self):
+        return max(self.scores)
+
+
 def main():
     game = MarbleGame(424, 71144)
     game.play()
@@ -54,7 +208,7 @@ def main():
     print("Part 1:", game.winning_score)
 
     game = MarbleGame(424, 71144 * 100)
-    game.play()
+    game.play(blocks=True)
 
     print("Part 2:", game.winning_score)
 
@@ -71,6 +225,8 @@ class TestMarbles(unittest.TestCase):
     21 players; last marble is worth 6111 points: high score is 54718
     30 players; last marble is worth 5807 points: high score is 37305
     """
+    examples = [(10, 1618, 8317), (13, 7999, 146373), (17, 1104, 2764), (21, 6111, 54718), (30, 5807, 37305)]
+
     def setUp(self):
         self.game = MarbleGame(9, 25)
 
@@ -78,6 +234,45 @@ class TestMarbles(unittest.TestCase):
         self.game.play()
         assert self.game.winning_score == 32
 
+    def test_play_blocks(self):
+        self.game.play(blocks=True)
+        assert self.game.winning_score == 32
+
+        for num_players, last_marble, high_score in self.examples:
+            game = MarbleGame(num_players, last_marble)
+            game.play(blocks=True)
+            assert game.winning_score == high_score
+
+    def test_play_blocks_matches_play(self):
+        for last_marble in range(1, 120):
+            game = MarbleGame(7, last_marble)
+            game.play()
+            fast = MarbleGame(7, last_marble)
+            fast.play(blocks=True)
+            assert fast.players == game.players
+            assert list(fast.marbles) == list(game.marbles)
+
+    def test_array_marbles(self):
+        for skip_ahead in (False, True):
+            game = ArrayMarbleGame(9, 25, skip_ahead=skip_ahead)
+            game.play()
+            assert game.winning_score == 32
+            assert repr(game) == "ArrayMarbleGame(0 16 8 17 4 18 19 2 24 20 25 10 21 5 22 11 1 12 6 13 3 14 7 15)"
+
+        for num_players, last_marble, high_score in self.examples:
+            for skip_ahead in (False, True):
+                game = ArrayMarbleGame(num_players, last_marble, skip_ahead=skip_ahead)
+                game.play()
+                assert game.winning_score == high_score
+
+    def test_array_marbles_match_deque(self):
+        for last_marble in range(1, 120):
+            game = MarbleGame(7, last_marble)
+            game.play()
+            fast = ArrayMarbleGame(7, last_marble)
+            fast.play()
+            assert list(fast.scores) == [game.players[player] for player in range(7)]
+
 
 """
 --- Day 9: Marble Mania ---
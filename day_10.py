@@ -1,19 +1,57 @@
 import unittest
 import re
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 pattern = re.compile("position=<(.+)> velocity=<(.+)>")
 lines = [line.strip() for line in open("input/day_10.txt").readlines()]
 
 
+GLYPH_WIDTH = 6
+GLYPH_HEIGHT = 10
+GLYPH_PITCH = 8  # six columns of letter, two of space
+
+GLYPH_ROWS = {
+    'A': "..##.. .#..#. #....# #....# #....# ###### #....# #....# #....# #....#",
+    'B': "#####. #....# #....# #....# #####. #....# #....# #....# #....# #####.",
+    'C': ".####. #....# #..... #..... #..... #..... #..... #..... #....# .####.",
+    'E': "###### #..... #..... #..... #####. #..... #..... #..... #..... ######",
+    'F': "###### #..... #..... #..... #####. #..... #..... #..... #..... #.....",
+    'G': ".####. #....# #..... #..... #..... #..### #....# #....# #...## .###.#",
+    'H': "#....# #....# #....# #....# ###### #....# #....# #....# #....# #....#",
+    'J': "...### ....#. ....#. ....#. ....#. ....#. ....#. #...#. #...#. .###..",
+    'K': "#....# #...#. #..#.. #.#... ##.... ##.... #.#... #..#.. #...#. #....#",
+    'L': "#..... #..... #..... #..... #..... #..... #..... #..... #..... ######",
+    'N': "#....# ##...# ##...# #.#..# #.#..# #..#.# #..#.# #...## #...## #....#",
+    'P': "#####. #....# #....# #....# #####. #..... #..... #..... #..... #.....",
+    'R': "#####. #....# #....# #....# #####. #..#.. #...#. #...#. #....# #....#",
+    'X': "#....# #....# .#..#. .#..#. ..##.. ..##.. .#..#. .#..#. #....# #....#",
+    'Z': "###### .....# .....# ....#. ...#.. ..#... .#.... #..... #..... ######",
+}
+
+GLYPHS = {
+    letter: np.array([[c == '#' for c in row] for row in rows.split()])
+    for letter, rows in GLYPH_ROWS.items()
+}
+
+
+def read_glyph(bitmap, max_mismatch=4):
+    """
+    The letter whose template is closest to a GLYPH_HEIGHT x GLYPH_WIDTH bitmap, or '?' if none are close.
+    """
+    letter, mismatch = min(
+        ((letter, int(np.count_nonzero(glyph != bitmap))) for letter, glyph in GLYPHS.items()),
+        key=lambda pair: pair[1],
+    )
+    return letter if mismatch <= max_mismatch else '?'
+
+
 class Starmap:
 
     def __init__(self, star_count):
         self.star_count = star_count
-        self.positions = np.zeros((star_count, 2))
-        self.velocities = np.zeros((star_count, 2))
+        self.positions = np.zeros((star_count, 2), dtype=np.int64)
+        self.velocities = np.zeros((star_count, 2), dtype=np.int64)
 
     @classmethod
     def starmap_from_string(cls, lines):
@@ -32,7 +70,11 @@ class Starmap:
 
     @property
     def ydiff(self):
-        return max(self.positions[:, 1]) - min(self.positions[:, 1])
+        return self.ydiff_at(0)
+
+    def ydiff_at(self, t):
+        y = self.positions[:, 1] + t * self.velocities[:, 1]
+        return int(y.max() - y.min())
 
     def step_forward(self):
         self.positions += self.velocities
@@ -40,21 +82,73 @@ class Starmap:
     def step_backwards(self):
         self.positions -= self.velocities
 
+    def estimate_convergence(self):
+        """
+        Least-squares guess at when the stars are closest together: the t that minimizes the variance of
+        y + t * vy, which is -cov(y, vy) / var(vy).
+        """
+        y = self.positions[:, 1]
+        vy = self.velocities[:, 1]
+        spread = np.var(vy)
+
+        if spread == 0:
+            return 0
+
+        return max(0, int(round(-np.mean((y - y.mean()) * (vy - vy.mean())) / spread)))
+
     def find_convergence(self):
-        start = 0
-        ydiff = self.ydiff
-        while True:
-            self.step_forward()
-            start += 1
-            if self.ydiff < ydiff:
-                ydiff = self.ydiff
+        """
+        Every y is linear in t, so the height of the bounding box is convex in t. Starting from the least-squares
+        estimate, widen the window until the height is rising, then ternary search it -- on integers that's a
+        binary search for the first second where the next step stops shrinking the box. Moves the stars to that
+        second and returns it.
+        """
+        hi = max(1, 2 * self.estimate_convergence())
+        while self.ydiff_at(hi + 1) < self.ydiff_at(hi):
+            hi *= 2
+
+        lo = 0
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ydiff_at(mid + 1) < self.ydiff_at(mid):
+                lo = mid + 1
             else:
-                self.step_backwards()  # we hit this when we go too far; rewind one step
-                break
+                hi = mid
+
+        self.positions += lo * self.velocities
+        return lo
+
+    def rasterize(self):
+        """
+        The stars as a bool bitmap indexed [y][x], cropped to their bounding box.
+        """
+        positions = self.positions - self.positions.min(axis=0)
+        width, height = positions.max(axis=0) + 1
 
-        print(start - 1)
+        bitmap = np.zeros((height, width), dtype=bool)
+        bitmap[positions[:, 1], positions[:, 0]] = True
+        return bitmap
+
+    def read_message(self):
+        """
+        Decode the converged stars without anyone having to look at them: rasterize, cut the bitmap into letters
+        every GLYPH_PITCH columns and match each against the templates. Only works for the 10-row puzzle font.
+        """
+        bitmap = self.rasterize()
+
+        if bitmap.shape[0] != GLYPH_HEIGHT:
+            raise ValueError(f"Expected a message {GLYPH_HEIGHT} rows tall, got {bitmap.shape[0]}")
+
+        padded = np.zeros((GLYPH_HEIGHT, bitmap.shape[1] + GLYPH_PITCH), dtype=bool)
+        padded[:, :bitmap.shape[1]] = bitmap
+
+        return ''.join(
+            read_glyph(padded[:, x:x + GLYPH_WIDTH]) for x in range(0, bitmap.shape[1], GLYPH_PITCH)
+        )
 
     def draw(self):
+        import matplotlib.pyplot as plt  # only needed to look at the stars, so keep it off the import path
+
         plt.scatter(self.positions[:, 0], self.positions[:, 1])
         plt.gca().invert_yaxis()
         plt.show()
@@ -62,8 +156,9 @@ class Starmap:
 
 def main():
     starmap = Starmap.starmap_from_string(lines)
-    starmap.find_convergence()
-    starmap.draw()
+    seconds = starmap.find_convergence()
+    print("Part 1:", starmap.read_message())
+    print("Part 2:", seconds)
 
 
 if __name__ == '__main__':
@@ -109,8 +204,43 @@ class TestStarmap(unittest.TestCase):
             lines=TestStarmap.test_map.strip().split('\n'),
         )
 
+        assert starmap.estimate_convergence() == 3
+        assert starmap.find_convergence() == 3
+        assert starmap.positions.dtype == np.int64
+        assert starmap.ydiff == 7
+        assert starmap.rasterize().shape == (8, 10)
+
+    def test_read_message(self):
+        starmap = Starmap.starmap_from_string(lines)
         starmap.find_convergence()
-        starmap.draw()
+        assert starmap.read_message() == 'KBJHEZCB'
+
+    def test_read_glyphs(self):
+        word = 'FLANGEPRX'
+        stars = [
+            (i * GLYPH_PITCH + x, y)
+            for i, letter in enumerate(word)
+            for y, x in zip(*np.nonzero(GLYPHS[letter]))
+        ]
+        starmap = Starmap(len(stars))
+        starmap.positions[:] = stars
+        assert starmap.read_message() == word
+
+    def test_find_convergence_matches_stepping(self):
+        starmap = Starmap.starmap_from_string(lines)
+        stepped = Starmap.starmap_from_string(lines)
+
+        seconds = 0
+        while True:
+            ydiff = stepped.ydiff
+            stepped.step_forward()
+            if stepped.ydiff >= ydiff:
+                stepped.step_backwards()
+                break
+            seconds += 1
+
+        assert starmap.find_convergence() == seconds
+        assert (starmap.positions == stepped.positions).all()
 
 
 
@@ -1,4 +1,6 @@
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import os
 import numpy as np
 import unittest
 
@@ -15,11 +17,11 @@ class FuelCells:
         self.serial_number = serial_number
         self.size = size
 
-        self.cells = np.zeros((size, size))
+        self.cells = np.zeros((size, size), dtype=np.int32)  # cells[x - 1][y - 1] is the cell at x, y
         self.summed = None
 
         self.set_cell_power_levels()
-        self.summed = self.cells.cumsum(axis=0).cumsum(axis=1)  # See wikipedia summed-area table
+        self.summed = self.summed_area_table(self.cells)
 
     @staticmethod
     def serial_to_power_level(serial, x, y):
@@ -41,48 +43,168 @@ class FuelCells:
         return power_level - 5
 
     def set_cell_power_levels(self):
-        for x in range(self.size):
-            for y in range(self.size):
-                self.cells[x][y] = self.serial_to_power_level(self.serial_number, x, y)
+        """
+        serial_to_power_level is plain arithmetic, so it works on whole arrays: broadcasting a column of x
+        coordinates against a row of y coordinates fills the grid in one go.
+        """
+        coords = np.arange(1, self.size + 1, dtype=np.int32)
+        self.cells[:] = self.serial_to_power_level(self.serial_number, coords[:, None], coords[None, :])
+
+    @staticmethod
+    def summed_area_table(cells):
+        """
+        See wikipedia summed-area table. Padded with a leading row and column of zeros, so summed[x][y] is the
+        total of cells[:x, :y] and no window needs a special case at the edge.
+        """
+        summed = np.zeros((cells.shape[0] + 1, cells.shape[1] + 1), dtype=np.int32)
+        summed[1:, 1:] = cells.cumsum(axis=0).cumsum(axis=1)
+        return summed
+
+    def window_totals(self, size):
+        """
+        Total power of every size x size square at once; totals[x - 1][y - 1] is the square with its top-left
+        corner at x, y.
+        """
+        return window_sums(self.summed, size)
 
     def find_highest_total_power(self, size=3):
-        point = None
-        highest = 0
-        for x in range(self.size - size):
-            for y in range(self.size - size):
-                total = self.total_in_square(x, y, size)
-                if total > highest:
-                    point = Point(x + 1, y + 1)  # +1 translates from 0 based to 1 based as per requirements
-                    highest = total
+        totals = self.window_totals(size)
+        x, y = np.unravel_index(totals.argmax(), totals.shape)
 
-        return point, highest
+        return Point(int(x) + 1, int(y) + 1), int(totals[x, y])
 
-    def find_highest_any_size(self):
+    def find_highest_any_size(self, processes=None):
         """
-        Yikes, this is slow as shit. Should find a way to refactor.
+        Best square of any size, as (point, size, power). Ties go to the smallest size, then the first corner.
+
+        A size k square can't total more than k * k * max_cell, so once a size 3 square (the usual answer's
+        neighbourhood) sets a bar, every size whose bound is below it is skipped. The remaining sizes are split
+        into interleaved batches and fanned out over a process pool; processes=1 stays in this process.
         """
-        size = 1
-        point = None
-        highest = 0
-        for i in range(1, self.size - 1):
-            location, power = self.find_highest_total_power(size=i)
-            if power > highest:
-                highest = power
-                point = location
-                size = i
+        max_cell = int(self.cells.max())
+        point, highest = self.find_highest_total_power(size=min(3, self.size))
+        sizes = [k for k in range(1, self.size + 1) if k * k * max_cell >= highest]
 
-        return point, size, highest
+        if processes == 1:
+            results = best_windows(self.summed, sizes)
+        else:
+            processes = processes or os.cpu_count()
+            batches = [sizes[i::processes] for i in range(processes)]
+
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = [result for batch in pool.map(best_windows, [self.summed] * len(batches), batches)
+                           for result in batch]
+
+        power, size, x, y = max(results, key=lambda result: (result[0], -result[1]))
+        return Point(x, y), size, power
+
+    @staticmethod
+    def power_grids(serials, size=300):
+        """
+        A (len(serials), size, size) stack of power grids, the same steps as serial_to_power_level. The rack IDs
+        and the rack ID * y products don't depend on the serial, so they're computed once and broadcast.
+        """
+        coords = np.arange(1, size + 1, dtype=np.int32)
+        rack_id = coords[:, None] + 10
+        rack_times_y = rack_id * coords[None, :]
+        serials = np.asarray(serials, dtype=np.int32)[:, None, None]
+
+        return (rack_times_y + serials) * rack_id // 100 % 10 - 5
+
+    @classmethod
+    def find_highest_any_size_batch(cls, serials, size=300, group=4):
+        """
+        find_highest_any_size for many serial numbers at once, as a list of (point, size, power) in the same
+        order. The grids are built in one vectorized pass, then searched group serials at a time so each
+        window size's stack of totals stays small enough to sit in cache.
+        """
+        cells = cls.power_grids(serials, size)
+        max_cell = int(cells.max())
+        results = []
+
+        for start in range(0, len(cells), group):
+            results.extend(cls.best_squares(cells[start:start + group], max_cell))
+
+        return results
+
+    @staticmethod
+    def best_squares(cells, max_cell):
+        """
+        Best square of any size for each grid in a (count, size, size) stack, with the same tie-breaks as
+        find_highest_any_size.
+
+        A k x k square splits into n * n squares of size k // n plus a strip of leftover cells, so its total is
+        at most n * n times the best of those squares plus max_cell for each leftover cell; halves and thirds
+        both give useful bounds. Sizes are tried in order, keeping the tighter bound per serial, and a size is
+        skipped once no serial's bound beats its running best. A skipped size's bound stands in for its best
+        when larger sizes work out theirs.
+        """
+        count, size, _ = cells.shape
+        summed = np.zeros((count, size + 1, size + 1), dtype=np.int32)
+        summed[:, 1:, 1:] = cells.cumsum(axis=1).cumsum(axis=2)
+
+        rows = np.arange(count)
+        bound = np.zeros((size + 1, count), dtype=np.int64)  # bound[k] is at least the best k x k total
+        best_power = np.full(count, np.iinfo(np.int64).min, dtype=np.int64)
+        best_size, best_x, best_y = (np.zeros(count, dtype=np.int64) for _ in range(3))
+
+        for k in range(1, size + 1):
+            bound[k] = np.minimum.reduce([
+                n * n * bound[k // n] + (k * k - n * n * (k // n) ** 2) * max_cell for n in (2, 3)
+            ])
+            if (bound[k] <= best_power).all():
+                continue
+
+            width = size + 1 - k
+            totals = window_sums(summed, k).reshape(count, -1)
+            flat = totals.argmax(axis=1)
+            bound[k] = powers = totals[rows, flat]
+
+            better = powers > best_power
+            best_power = np.where(better, powers, best_power)
+            best_size = np.where(better, k, best_size)
+            best_x = np.where(better, flat // width + 1, best_x)
+            best_y = np.where(better, flat % width + 1, best_y)
+
+        return [
+            (Point(int(x), int(y)), int(k), int(power))
+            for power, k, x, y in zip(best_power, best_size, best_x, best_y)
+        ]
 
     def total_in_square(self, x, y, size):
         """
-        # See wikipedia summed-area table
+        Total power of the size x size square with its top-left corner at x, y.
         """
+        x, y = x - 1, y - 1
         a = self.summed[x][y]
         b = self.summed[x + size][y]
         c = self.summed[x][y + size]
         d = self.summed[x + size][y + size]
 
-        return d - b - c + a
+        return int(d - b - c + a)
+
+
+def window_sums(summed, k):
+    """
+    Total of every k x k window of a padded summed-area table; the last two axes are the grid, and any leading
+    axes (a stack of tables) are carried through. Differencing rows k apart and then columns k apart is the
+    usual four corner sum in two passes rather than three.
+    """
+    rows = summed[..., k:, :] - summed[..., :-k, :]
+    return rows[..., k:] - rows[..., :-k]
+
+
+def best_windows(summed, sizes):
+    """
+    The best (power, size, x, y) for each size, read off a padded summed-area table.
+    """
+    results = []
+    for k in sizes:
+        totals = window_sums(summed, k)
+        x, y = np.unravel_index(totals.argmax(), totals.shape)
+        results.append((int(totals[x, y]), k, int(x) + 1, int(y) + 1))
+
+    return results
 
 
 class TestFuelCells(unittest.TestCase):
@@ -109,9 +231,19 @@ class TestFuelCells(unittest.TestCase):
          1   1   2   4  -3
         -1   0   2  -5  -2
         """
-        point, power = FuelCells(18).find_highest_total_power(size=3)
+        cells = FuelCells(18)
+        point, power = cells.find_highest_total_power(size=3)
         assert point == Point(33, 45)
         assert power == 29
+        assert cells.total_in_square(33, 45, 3) == 29
+        assert cells.cells[32][44] == 4  # 33,45
+
+    def test_windows_reach_the_edge(self):
+        cells = FuelCells(18)
+        assert cells.window_totals(1).shape == (300, 300)
+        assert cells.window_totals(300).shape == (1, 1)
+        assert cells.window_totals(300)[0][0] == cells.cells.sum()
+        assert cells.total_in_square(300, 300, 1) == FuelCells.serial_to_power_level(18, 300, 300)
 
     def test_find_highest_any_size(self):
         """
@@ -124,6 +256,36 @@ class TestFuelCells(unittest.TestCase):
         assert size == 16
         assert power == 113
 
+        assert FuelCells(42).find_highest_any_size(processes=1) == (Point(232, 251), 12, 119)
+
+    def test_find_highest_any_size_matches_every_size(self):
+        cells = FuelCells(puzzle_serial_number, size=60)
+        results = [cells.find_highest_total_power(size=k) for k in range(1, 61)]
+        power = max(power for _, power in results)
+        size = next(k for k, (_, p) in enumerate(results, start=1) if p == power)
+        assert cells.find_highest_any_size(processes=2) == (results[size - 1][0], size, power)
+
+    def test_power_grids(self):
+        grids = FuelCells.power_grids([57, 39, 71])
+        assert grids[0][121][78] == -5
+        assert grids[1][216][195] == 0
+        assert grids[2][100][152] == 4
+        assert (grids[1] == FuelCells(39).cells).all()
+
+    def test_find_highest_any_size_batch(self):
+        serials = [18, 42, puzzle_serial_number, 7]
+        expected = [FuelCells(serial).find_highest_any_size(processes=1) for serial in serials]
+        assert FuelCells.find_highest_any_size_batch(serials) == expected
+        assert FuelCells.find_highest_any_size_batch(serials, group=3) == expected
+
+    def test_best_squares_matches_every_size(self):
+        cells = FuelCells(puzzle_serial_number, size=60)
+        results = [cells.find_highest_total_power(size=k) for k in range(1, 61)]
+        power = max(power for _, power in results)
+        size = next(k for k, (_, p) in enumerate(results, start=1) if p == power)
+        assert FuelCells.best_squares(cells.cells[None], int(cells.cells.max())) == \
+            [(results[size - 1][0], size, power)]
+
     def test_main_puzzle_part_1(self):
         point, power = FuelCells(puzzle_serial_number).find_highest_total_power(size=3)
         assert point == Point(20, 54)
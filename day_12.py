@@ -1,4 +1,5 @@
-from collections import deque, defaultdict
+from itertools import islice, product
+import numpy as np
 import unittest
 
 puzzle_state = "#.#.#..##.#....#.#.##..##.##..#..#...##....###..#......###.#..#.....#.###.#...#####.####...#####.#.#"
@@ -19,39 +20,316 @@ puzzle_set = {
 }
 
 
+class MacroCell:
+    """
+    A run of 2 ** level pots. Level 2 cells are leaves holding their four pots as bits (bit i is pot i); higher
+    levels are a pair of half-size cells. Cells are hash-consed by Hashlife, so identical runs share one object.
+    """
+
+    __slots__ = ('level', 'left', 'right', 'bits', 'population', 'weight', 'first', 'last')
+
+    def __init__(self, level, left=None, right=None, bits=0):
+        self.level = level
+        self.left = left
+        self.right = right
+        self.bits = bits
+
+        if left is None:
+            live = [i for i in range(4) if bits >> i & 1]
+            self.population = len(live)
+            self.weight = sum(live)  # sum of the live pots' positions within the cell
+            self.first = live[0] if live else None
+            self.last = live[-1] if live else None
+        else:
+            half = 1 << (level - 1)
+            self.population = left.population + right.population
+            self.weight = left.weight + right.weight + right.population * half
+            self.first = left.first if left.population else (half + right.first if right.population else None)
+            self.last = half + right.last if right.population else left.last
+
+
+class Hashlife:
+    """
+    Memoized evolution for a radius-2 rule, the 1D take on hashlife. successor(cell, j) gives the middle half
+    of a cell after 2 ** j generations, built from the successors of overlapping half-size cells, and every
+    result is cached against the cell that produced it, so repeated structure in space or time is only ever
+    worked out once.
+
+    cache_limit bounds how many joined cells and results are kept; when it's exceeded the oldest half of each
+    cache is dropped. That costs recomputation, never correctness.
+    """
+
+    def __init__(self, rules, cache_limit=1 << 20):
+        self.rules = rules
+        self.cache_limit = cache_limit
+        self.leaves = [MacroCell(2, bits=bits) for bits in range(16)]
+        self.joins = {}
+        self.results = {}
+        self.empties = [None, None, self.leaves[0]]
+
+    def join(self, left, right):
+        key = left, right
+        cell = self.joins.get(key)
+
+        if cell is None:
+            cell = self.joins[key] = MacroCell(left.level + 1, left, right)
+            self._evict()
+
+        return cell
+
+    def empty(self, level):
+        while len(self.empties) <= level:
+            self.empties.append(self.join(self.empties[-1], self.empties[-1]))
+
+        return self.empties[level]
+
+    def center(self, cell):
+        if cell.level == 3:
+            return self.leaves[cell.left.bits >> 2 | (cell.right.bits & 3) << 2]
+
+        return self.join(cell.left.right, cell.right.left)
+
+    def successor(self, cell, j):
+        """
+        The middle 2 ** (level - 1) pots of a cell after 2 ** j generations, for j <= level - 3.
+        """
+        if not cell.population:
+            return self.empty(cell.level - 1)
+
+        key = cell, j
+        result = self.results.get(key)
+        if result is not None:
+            return result
+
+        if cell.level == 3:
+            result = self._step_leaf(cell)
+        else:
+            a, b, c = cell.left, self.join(cell.left.right, cell.right.left), cell.right
+
+            if j == cell.level - 3:
+                a, b, c = self.successor(a, j - 1), self.successor(b, j - 1), self.successor(c, j - 1)
+                j -= 1
+            else:
+                a, b, c = self.center(a), self.center(b), self.center(c)
+
+            result = self.join(self.successor(self.join(a, b), j), self.successor(self.join(b, c), j))
+
+        self.results[key] = result
+        self._evict()
+        return result
+
+    def _step_leaf(self, cell):
+        pots = cell.left.bits | cell.right.bits << 4
+        bits = 0
+
+        for i in range(4):
+            code = 0
+            for t in range(5):
+                code = code << 1 | (pots >> (i + t) & 1)
+            bits |= int(self.rules[code]) << i
+
+        return self.leaves[bits]
+
+    def _evict(self):
+        if len(self.joins) + len(self.results) <= self.cache_limit:
+            return
+
+        for cache in (self.joins, self.results):
+            for key in list(islice(cache, len(cache) // 2)):
+                del cache[key]
+
+    def from_pots(self, pots):
+        level = 3
+        while 1 << level < len(pots):
+            level += 1
+
+        bits = np.zeros(1 << level, dtype=np.uint8)
+        bits[:len(pots)] = pots
+        cells = [self.leaves[int(q[0] | q[1] << 1 | q[2] << 2 | q[3] << 3)] for q in bits.reshape(-1, 4)]
+
+        while len(cells) > 1:
+            cells = [self.join(left, right) for left, right in zip(cells[::2], cells[1::2])]
+
+        return cells[0]
+
+    def expand(self, cell):
+        """
+        The same pots, centered in a cell twice the size.
+        """
+        empty = self.empty(cell.level - 1)
+        return self.join(self.join(empty, cell.left), self.join(cell.right, empty))
+
+    @staticmethod
+    def has_room(cell, j):
+        """
+        After 2 ** j generations the pots can spread at most 2 ** (j + 1) each way. Keeping them inside the middle
+        quarter of a cell at least 2 ** (j + 4) long means the successor, the middle half, still holds them all.
+        """
+        size = 1 << cell.level
+        return cell.level >= j + 4 and (
+            not cell.population or (cell.first >= 3 * size // 8 and cell.last < 5 * size // 8)
+        )
+
+    @staticmethod
+    def to_pots(cell):
+        """
+        The pots from the cell's first plant to its last, and where that run starts within the cell.
+        """
+        if not cell.population:
+            return np.zeros(0, dtype=np.uint8), 0
+
+        first = cell.first
+        pots = np.zeros(cell.last - first + 1, dtype=np.uint8)
+        stack = [(cell, 0)]
+
+        while stack:
+            cell, position = stack.pop()
+
+            if not cell.population:
+                continue
+            elif cell.left is None:
+                for i in range(4):
+                    if cell.bits >> i & 1:
+                        pots[position + i - first] = 1
+            else:
+                stack.append((cell.left, position))
+                stack.append((cell.right, position + (1 << (cell.level - 1))))
+
+        return pots, first
+
+
 class Plants:
+    """
+    Pots are a NumPy uint8 array covering only the live span, from the leftmost to the rightmost plant, plus the
+    pot number of its first cell. Each generation reads every pot's LLCRR neighbourhood as a 5-bit code by
+    shifting and ORing slices of the padded array, and looks the codes up in a 32-entry rule table.
+    """
 
     def __init__(self, initial_state, plant_set):
-        self.current_state = defaultdict(lambda: '.')
         self.plant_set = plant_set
+        self.rules = np.zeros(32, dtype=np.uint8)
+
+        for pattern in plant_set:
+            self.rules[self.pattern_code(pattern)] = 1
 
-        for i, c in enumerate(initial_state):
-            self.current_state[i] = c
+        if self.rules[0]:
+            raise ValueError("Rule '.....' => '#' would fill infinitely many pots")
+
+        self.pots = np.array([c == '#' for c in initial_state], dtype=np.uint8)
+        self.offset = 0  # pot number of self.pots[0]
+        self.generation = 0
+        self._trim()
 
     def __repr__(self):
-        return ''.join([self.current_state[i] for i in self._current_range()])
+        return ''.join('#' if pot else '.' for pot in self.pots)
+
+    @staticmethod
+    def pattern_code(pattern):
+        code = 0
+        for c in pattern:
+            code = code << 1 | (c == '#')
+        return code
 
     def step(self, num_steps=1):
         """
-        Advances the state by one generation
+        Advances the state by num_steps generations
         """
         for _ in range(num_steps):
-            new_state = defaultdict(lambda: '.')
+            padded = np.zeros(len(self.pots) + 8, dtype=np.uint8)
+            padded[4:-4] = self.pots
 
-            for i in self._current_range():
-                pots = ''.join([self.current_state[x] for x in range(i - 2, i + 3)])
-                if pots in self.plant_set:
-                    new_state[i] = "#"
-                else:
-                    new_state[i] = '.'
+            codes = padded[:-4] << 4 | padded[1:-3] << 3 | padded[2:-2] << 2 | padded[3:-1] << 1 | padded[4:]
+            self.pots = self.rules[codes]
+            self.offset -= 2
+            self.generation += 1
+            self._trim()
 
-            self.current_state = new_state
+    def run(self, generations):
+        """
+        Advance to the given generation and return the sum, however far off it is. Every generation's live span
+        is remembered by its bytes; as soon as one repeats, the row has entered a cycle of period p that shifts it
+        by some fixed number of pots each time round. The whole periods left are then skipped by moving the
+        offset, and only the leftover generations are actually stepped.
+        """
+        seen = {}
+
+        while self.generation < generations:
+            key = self.pots.tobytes()
+
+            if key in seen:
+                first_generation, first_offset = seen[key]
+                period = self.generation - first_generation
+                cycles = (generations - self.generation) // period
+
+                self.offset += cycles * (self.offset - first_offset)
+                self.generation += cycles * period
+                self.step(generations - self.generation)
+                break
+
+            seen[key] = self.generation, self.offset
+            self.step()
+
+        return self.sum()
+
+    def leap(self, generations, cache_limit=1 << 20):
+        """
+        Advance to the given generation with hashlife, for rules that never settle into a cycle run() could
+        skip. The plants are written back as pots, so their span has to fit in memory; sum_after() doesn't
+        have that limit.
+        """
+        cell, origin = self._evolve(generations, cache_limit)
+        self.pots, first = Hashlife.to_pots(cell)
+        self.offset = origin + first
+        self.generation = generations
+        return self.sum()
+
+    def sum_after(self, generations, cache_limit=1 << 20):
+        """
+        The sum at the given generation, read straight off the hashlife cells without changing these plants.
+        """
+        cell, origin = self._evolve(generations, cache_limit)
+        return cell.weight + cell.population * origin
+
+    def _evolve(self, generations, cache_limit):
+        """
+        Each jump covers the largest power of two generations still to go, growing the universe first whenever
+        the plants are too close to its edge for that jump. Returns the final cell and the pot number of its
+        first pot.
+        """
+        engine = Hashlife(self.rules, cache_limit=cache_limit)
+        cell = engine.from_pots(self.pots)
+        origin = self.offset
+        generation = self.generation
+
+        while generation < generations:
+            j = (generations - generation).bit_length() - 1
+
+            while not engine.has_room(cell, j):
+                origin -= 1 << (cell.level - 1)
+                cell = engine.expand(cell)
+
+            origin += 1 << (cell.level - 2)
+            cell = engine.successor(cell, j)
+            generation += 1 << j
+
+        return cell, origin
 
     def sum(self):
-        return sum(k for k, v in self.current_state.items() if v == "#")
+        """
+        Done in Python ints so offsets from very long runs can't overflow.
+        """
+        live = np.flatnonzero(self.pots)
+        return int(live.sum()) + len(live) * self.offset
+
+    def _trim(self):
+        live = np.flatnonzero(self.pots)
 
-    def _current_range(self):
-        return range(-3, len(self.current_state.items()) + 2)  # todo figure out how to make this expand appropriately
+        if not len(live):
+            self.pots = self.pots[:0]
+            return
+
+        self.pots = self.pots[live[0]:live[-1] + 1]
+        self.offset += int(live[0])
 
 
 class TestPlants(unittest.TestCase):
@@ -89,19 +367,78 @@ class TestPlants(unittest.TestCase):
             plants.step()
 
         assert(plants.sum() == 325)
+        assert plants.offset == -2
+        assert repr(plants) == "#....##....#####...#######....#.#..##"
+
+    def test_pattern_code(self):
+        assert Plants.pattern_code(".....") == 0
+        assert Plants.pattern_code("#...#") == 17
+        assert Plants.pattern_code("#####") == 31
+
+    def test_empty_row_stays_empty(self):
+        plants = Plants(initial_state="#", plant_set={"#####"})
+        plants.step(5)
+        assert plants.sum() == 0
+        assert repr(plants) == ""
 
     def test_puzzle_part_1(self):
         plants = Plants(initial_state=puzzle_state, plant_set=puzzle_set)
         plants.step(20)
         assert plants.sum() == 1917
 
-    def test_puzzle_part_2(self):
+    def test_run(self):
+        for generations in (0, 1, 20, 150, 333):
+            stepped = Plants(initial_state=puzzle_state, plant_set=puzzle_set)
+            stepped.step(generations)
+            assert Plants(initial_state=puzzle_state, plant_set=puzzle_set).run(generations) == stepped.sum()
+
+    def test_run_with_period(self):
+        """
+        A blinker: a lone plant becomes a pair and the pair becomes a lone plant again, every 2 generations.
+        """
+        blinker = {"..#..", ".#...", "..##."}
+        for generations in (10 ** 9, 10 ** 9 + 1):
+            stepped = Plants(initial_state="#", plant_set=blinker)
+            stepped.step(generations % 2)
+            assert Plants(initial_state="#", plant_set=blinker).run(generations) == stepped.sum()
+
+    def test_leap(self):
+        rules = [
+            (self.test_initial_state, self.test_set),
+            (puzzle_state, puzzle_set),
+            ("#", {"..#..", ".#...", "...#.", "#...#"}),  # keeps growing, never cycles
+        ]
+
+        for initial_state, plant_set in rules:
+            for generations, cache_limit in ((0, 1 << 20), (1, 1 << 20), (20, 64), (137, 1 << 20), (300, 500)):
+                stepped = Plants(initial_state=initial_state, plant_set=plant_set)
+                stepped.step(generations)
+                leapt = Plants(initial_state=initial_state, plant_set=plant_set)
+                assert leapt.leap(generations, cache_limit=cache_limit) == stepped.sum()
+                assert repr(leapt) == repr(stepped)
+                assert not len(stepped.pots) or leapt.offset == stepped.offset
+
         plants = Plants(initial_state=puzzle_state, plant_set=puzzle_set)
-        plants.step(100)  # the sum added seems to repeat after around #100; it just adds 25 each step
+        assert plants.sum_after(50 * 10 ** 9) == 1250000000991
+        assert plants.leap(50 * 10 ** 9) == 1250000000991
+
+    def test_sum_after_without_a_cycle(self):
+        """
+        Each plant flips if exactly one of its immediate neighbours had a plant: a Sierpinski triangle that never
+        repeats, so run() has nothing to skip.
+        """
+        sierpinski = {''.join(p) for p in product('.#', repeat=5) if (p[1] == '#') != (p[3] == '#')}
+
+        stepped = Plants(initial_state="#", plant_set=sierpinski)
+        stepped.step(777)
+        assert Plants(initial_state="#", plant_set=sierpinski).sum_after(777, cache_limit=200) == stepped.sum()
 
-        part_2 = plants.sum() + (50e9 - 100) * 25
+        # after 2 ** k generations only the two corners of the triangle are left, 2 ** k either side of pot 3
+        assert Plants(initial_state="...#", plant_set=sierpinski).sum_after(2 ** 40) == 6
 
-        print(part_2)  # 1250000000991
+    def test_puzzle_part_2(self):
+        plants = Plants(initial_state=puzzle_state, plant_set=puzzle_set)
+        assert plants.run(50 * 10 ** 9) == 1250000000991
 
 
 
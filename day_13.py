@@ -5,41 +5,161 @@ from collections import namedtuple
 Point = namedtuple("Point", ['x', 'y'])
 
 
+DIRECTIONS = '>^<v'  # counter-clockwise, so adding one is a left turn
+DX = (1, 0, -1, 0)
+DY = (0, -1, 0, 1)
+
+CURVES = {
+    '/': (1, 0, 3, 2),  # > becomes ^, ^ becomes >, < becomes v, v becomes <
+    '\\': (3, 2, 1, 0),  # > becomes v, ^ becomes <, < becomes ^, v becomes >
+}
+
+INTERSECTION_TURNS = tuple(
+    tuple((direction + delta) % 4 for direction in range(4))
+    for delta in (1, 0, -1)  # left, straight, right
+)
+
+
 class Cart:
     """
-    Keeps track of its own location, and makes appropriate turns based on the spec.
+    Keeps track of its own location, and makes appropriate turns based on the spec. The direction is an index
+    into DIRECTIONS so every turn is a table lookup.
     """
 
-    turn_order = ['>', '^', '<', 'v']  # left turns
-
     def __init__(self, char, point):
-        self.char = char
-        self.point = point
+        self.direction = DIRECTIONS.index(char)
+        self.x, self.y = point
         self.intersections = 0  # number of "+" intersections seen by this cart
+        self.crashed = False
 
     def __repr__(self):
         return f"Cart({self.char}, {self.point})"
 
+    @property
+    def char(self):
+        return DIRECTIONS[self.direction]
+
+    @property
+    def point(self):
+        return Point(self.x, self.y)
+
     def turn(self):
         """
         Each time a cart has the option to turn (by arriving at any intersection), it turns left the first
         time, goes straight the second time, turns right the third time, and then repeats...
         """
-        cycle = self.intersections % 3
-        curr = Cart.turn_order.index(self.char)
-        delta = 0
-
-        if cycle == 0:  # turn left
-            delta = 1
-        elif cycle == 1:  # go straight
-            pass
-        elif cycle == 2:  # turn right
-            delta = -1
-
-        self.char = Cart.turn_order[(curr + delta) % 4]
+        self.direction = INTERSECTION_TURNS[self.intersections % 3][self.direction]
         self.intersections += 1
 
 
+class CompiledTrack:
+    """
+    The track boiled down to its decision points, the curves and intersections, with the length of the straight
+    run leaving each one in each direction. Between decision points a cart just goes straight, so it can be
+    moved along a whole run at once.
+
+    Runs are worked out the first time a cart leaves a decision point that way and remembered after that, so
+    only track the carts actually cover is ever walked. Following the track from a decision point, rather than
+    scanning the grid, means tracks that merely run side by side are never confused.
+    """
+
+    decision_chars = {"/", "\\", "+"}
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.segments = {}  # (x, y, direction) -> cells to the next decision point
+
+    def distance_ahead(self, x, y, direction, limit=None):
+        """
+        Cells from x, y to the next decision point straight ahead, or None if there isn't one within limit.
+        """
+        distance = 0
+        while limit is None or distance < limit:
+            x += DX[direction]
+            y += DY[direction]
+            distance += 1
+
+            if self.lines[y][x] in self.decision_chars:
+                return distance
+
+        return None
+
+    def remaining(self, cart):
+        """
+        Cells until a cart on a decision point next has to turn, or None if it's partway along a run.
+        """
+        if self.lines[cart.y][cart.x] not in self.decision_chars:
+            return None
+
+        key = cart.x, cart.y, cart.direction
+        if key not in self.segments:
+            self.segments[key] = self.distance_ahead(*key)
+
+        return self.segments[key]
+
+
+def safe_ticks(a, b, horizon):
+    """
+    How many ticks carts a and b can both certainly move without meeting. For the first horizon ticks both go
+    straight, so their gap is followed exactly and only has to stay at two cells or more; after that either
+    might turn, and the gap can close by up to two cells a tick.
+    """
+    dx, dy = b.x - a.x, b.y - a.y
+    if a.direction == b.direction:  # the gap holds steady until one of them turns
+        return horizon + (abs(dx) + abs(dy) - 1) // 2 if abs(dx) + abs(dy) >= 2 else 0
+
+    ux, uy = DX[b.direction] - DX[a.direction], DY[b.direction] - DY[a.direction]
+
+    def gap(t):
+        return abs(dx + ux * t) + abs(dy + uy * t)
+
+    # the gap is convex in t, so it's smallest at an end or next to where one axis crosses zero
+    lowest = {0, horizon}
+    for d, u in ((dx, ux), (dy, uy)):
+        if u and 0 < -d * u:
+            lowest.update(t for t in (-d // u, -(d // u)) if t <= horizon)
+    low = min(lowest, key=gap)
+
+    if gap(low) >= 2:
+        return horizon + (gap(horizon) - 1) // 2
+
+    # the gap only shrinks on the way down to low, so look for the first tick it's under two
+    first, last = 0, low
+    while last - first > 1:
+        middle = (first + last) // 2
+        first, last = (middle, last) if gap(middle) >= 2 else (first, middle)
+
+    return 0 if gap(0) < 2 else first
+
+
+def jump_bound(carts, reach, straight_for):
+    """
+    How many ticks every cart can move at once without any two meeting. Carts are bucketed into reach-sized
+    squares; carts more than one bucket apart are more than reach cells apart and are safe for reach // 2
+    ticks, so only carts in the same or neighbouring buckets are compared, and only the ones close enough to
+    lower the bound go through safe_ticks. straight_for(cart) is how many ticks the cart goes straight for.
+    """
+    buckets = {}
+    for cart in carts:
+        buckets.setdefault((cart.x // reach, cart.y // reach), []).append(cart)
+
+    jump = reach // 2
+    for (bx, by), bucket in buckets.items():
+        others = list(bucket)
+        for key in ((bx + 1, by - 1), (bx + 1, by), (bx + 1, by + 1), (bx, by + 1)):
+            others.extend(buckets.get(key, ()))
+
+        for i, a in enumerate(bucket):
+            x, y = a.x, a.y
+            for b in others[i + 1:]:
+                if abs(x - b.x) + abs(y - b.y) <= 2 * jump:
+                    jump = min(jump, safe_ticks(a, b, min(straight_for(a), straight_for(b))))
+                    if not jump:
+                        return 0
+
+    return jump
+
+
 class MineCartMap:
 
     """
@@ -50,6 +170,9 @@ class MineCartMap:
 
     cart_chars = {"v", "^", ">", "<"}
 
+    MIN_JUMP = 8  # shorter jumps don't pay for working them out, so run() steps for a while instead
+    MAX_PATIENCE = 32  # most exact steps run() takes before looking for a jump again
+
     def __init__(self, lines):
         self.carts = list()
         self.lines = lines
@@ -86,46 +209,123 @@ class MineCartMap:
         return mine_cart_map
 
     def step(self):
-        ordered_carts = sorted(self.carts, key=lambda c: (c.point.y, c.point.x))  # sort by y then x
+        """
+        One tick. Carts move in reading order, and an occupancy dict keyed by position makes each collision
+        check a single lookup. Crashed carts come out of the dict at once, so nothing can hit them again and
+        they don't move for the rest of the tick.
+        """
+        ordered_carts = sorted(self.carts, key=lambda c: (c.y, c.x))  # sort by y then x
+        occupied = {(cart.x, cart.y): cart for cart in ordered_carts}
 
         for cart in ordered_carts:
-            if cart.char == ">":
-                cart.point = Point(cart.point.x + 1, cart.point.y)
-            elif cart.char == "<":
-                cart.point = Point(cart.point.x - 1, cart.point.y)
-            elif cart.char == "^":
-                cart.point = Point(cart.point.x, cart.point.y - 1)
-            elif cart.char == "v":
-                cart.point = Point(cart.point.x, cart.point.y + 1)
-
-            for other in ordered_carts:
-                if other is not cart and other.point == cart.point:
-                    self.collisions.append(cart.point)
-                    self.carts.remove(other)
-                    self.carts.remove(cart)
-
-            track = self.lines[cart.point.y][cart.point.x]
-
-            if track == "/":
-                if cart.char == "<":
-                    cart.char = "v"
-                elif cart.char == "^":
-                    cart.char = ">"
-                elif cart.char == ">":
-                    cart.char = "^"
-                elif cart.char == "v":
-                    cart.char = "<"
-            elif track == "\\":
-                if cart.char == ">":
-                    cart.char = "v"
-                elif cart.char == "^":
-                    cart.char = "<"
-                elif cart.char == "<":
-                    cart.char = "^"
-                elif cart.char == "v":
-                    cart.char = ">"
-            elif track == "+":
-                cart.turn()
+            if cart.crashed:
+                continue
+
+            del occupied[cart.x, cart.y]
+            cart.x += DX[cart.direction]
+            cart.y += DY[cart.direction]
+
+            other = occupied.pop((cart.x, cart.y), None)
+            if other:
+                cart.crashed = other.crashed = True
+                self.collisions.append(cart.point)
+                continue
+
+            occupied[cart.x, cart.y] = cart
+            self.turn_on_track(cart)
+
+        self.carts = [cart for cart in ordered_carts if not cart.crashed]
+
+    def run(self, until_first_crash=False):
+        """
+        Run until the first collision, or until there's at most one cart left, and return the number of ticks.
+
+        Two carts close by at most two cells a tick however the track bends, and while both go straight their
+        gap is known exactly, so jump_bound can say how many ticks every cart can move without any two
+        meeting. Each cart is then walked along the compiled runs, turning at every decision point it passes.
+        The bucket size jump_bound uses follows the last jump: it doubles while nothing nearby limits the jump,
+        and shrinks back to fit when something does.
+
+        Working out the bound costs several ticks' worth of stepping, so when the jump comes out shorter than
+        MIN_JUMP it also takes some exact step() calls before looking again. While it stays crowded that number
+        doubles, up to MAX_PATIENCE, which keeps a crowded map about as fast as plain stepping.
+        """
+        track = CompiledTrack(self.lines)
+        remaining = {cart: track.remaining(cart) for cart in self.carts}
+        reach = 4
+        patience = 1
+        ticks = 0
+
+        def straight_for(cart):
+            if remaining[cart] is None:
+                remaining[cart] = track.distance_ahead(cart.x, cart.y, cart.direction)
+            return remaining[cart]
+
+        def running():
+            return len(self.carts) > 1 and not (until_first_crash and self.collisions)
+
+        while running():
+            jump = jump_bound(self.carts, reach, straight_for)
+            reach = reach * 2 if jump == reach // 2 else max(4, 2 * jump + 2)
+
+            if jump:
+                for cart in self.carts:
+                    remaining[cart] = self.advance(cart, jump, remaining[cart], track)
+                ticks += jump
+
+            if jump >= self.MIN_JUMP:
+                patience = max(1, patience // 2)
+                continue
+
+            for _ in range(patience):
+                if not running():
+                    break
+
+                self.step()
+                ticks += 1
+                remaining = {
+                    cart: track.remaining(cart) if remaining[cart] in (1, None) else remaining[cart] - 1
+                    for cart in self.carts
+                }
+
+            patience = min(2 * patience, self.MAX_PATIENCE)
+
+        return ticks
+
+    def advance(self, cart, ticks, remaining, track):
+        """
+        Move a cart ticks cells along the track, turning at each decision point on the way, and return how far
+        it then is from the next one. A cart that started partway along a run (remaining is None) only has that
+        run walked as far as it needs to go.
+        """
+        while ticks:
+            if remaining is None:
+                remaining = track.distance_ahead(cart.x, cart.y, cart.direction, ticks)
+                if remaining is None:
+                    cart.x += DX[cart.direction] * ticks
+                    cart.y += DY[cart.direction] * ticks
+                    return None
+
+            if ticks < remaining:
+                cart.x += DX[cart.direction] * ticks
+                cart.y += DY[cart.direction] * ticks
+                return remaining - ticks
+
+            ticks -= remaining
+            cart.x += DX[cart.direction] * remaining
+            cart.y += DY[cart.direction] * remaining
+            self.turn_on_track(cart)
+            remaining = track.remaining(cart)
+
+        return remaining
+
+    def turn_on_track(self, cart):
+        track = self.lines[cart.y][cart.x]
+
+        if track in CURVES:
+            cart.direction = CURVES[track][cart.direction]
+        elif track == "+":
+            cart.turn()
 
 
 class TestMineCart(unittest.TestCase):
@@ -167,7 +367,90 @@ class TestMineCart(unittest.TestCase):
 
         print("Part 2:", puzzle_map.carts[0].point)
 
-        assert "Part 2:", puzzle_map.carts[0].point == Point(73, 121)
+        assert puzzle_map.carts[0].point == Point(73, 121)
+
+    def test_run(self):
+        for path, until_first_crash in (("input/day_13_test.txt", True), ("input/day_13_test_2.txt", False),
+                                        ("input/day_13.txt", True), ("input/day_13.txt", False)):
+            stepped = MineCartMap.map_from_filepath(path)
+            ticks = 0
+            while len(stepped.carts) > 1 and not (until_first_crash and stepped.collisions):
+                stepped.step()
+                ticks += 1
+
+            compiled = MineCartMap.map_from_filepath(path)
+            assert compiled.run(until_first_crash=until_first_crash) == ticks
+            assert compiled.collisions == stepped.collisions
+            assert [(c.point, c.char, c.intersections) for c in compiled.carts] == \
+                [(c.point, c.char, c.intersections) for c in stepped.carts]
+
+    def test_run_big_loop(self):
+        """
+        Two carts heading for each other round a big loop; the compiled run should cover the long straights in
+        a few jumps and still crash them in the same tick and cell as stepping does.
+        """
+        def loop_map(size, gap):
+            lines = [list("/" + "-" * (size - 2) + "\\"), list("|" + " " * (size - 2) + "|"),
+                     list("\\" + "-" * (size - 2) + "/")]
+            mine_cart_map = MineCartMap(lines)
+            mine_cart_map.carts = [Cart(">", Point(1, 0)), Cart(">", Point(1 + gap, 2))]
+            return mine_cart_map
+
+        for size, gap in ((40, 5), (40, 6), (41, 0), (2000, 700)):
+            stepped = loop_map(size, gap)
+            ticks = 0
+            while not stepped.collisions:
+                stepped.step()
+                ticks += 1
+
+            compiled = loop_map(size, gap)
+            assert compiled.run(until_first_crash=True) == ticks
+            assert compiled.collisions == stepped.collisions
+
+    def test_run_many_carts(self):
+        """
+        200 carts chasing each other round a big loop, beside a small loop where two carts meet head on. The
+        compiled run has to crash the pair in the same tick and cell as stepping does, and leave every other cart
+        where stepping does.
+        """
+        def loop_lines(width, height):
+            return [list("/" + "-" * (width - 2) + "\\")] + \
+                [list("|" + " " * (width - 2) + "|") for _ in range(height - 2)] + \
+                [list("\\" + "-" * (width - 2) + "/")]
+
+        def crowd_map(width=2000, height=100, count=200):
+            duel = loop_lines(width, 3)
+            lines = [row + [" "] + (duel[y] if y < len(duel) else []) for y, row in enumerate(loop_lines(width, height))]
+            mine_cart_map = MineCartMap(lines)
+
+            spacing = 2 * (width - 2) // count
+            mine_cart_map.carts = [Cart(">", Point(1 + i * spacing, 0)) for i in range(count // 2)]
+            mine_cart_map.carts += [Cart("<", Point(width - 2 - i * spacing, height - 1)) for i in range(count // 2)]
+            mine_cart_map.carts += [Cart(">", Point(width + 2, 0)), Cart(">", Point(width + 1 + width // 2, 2))]
+            return mine_cart_map
+
+        stepped = crowd_map()
+        ticks = 0
+        while not stepped.collisions:
+            stepped.step()
+            ticks += 1
+
+        compiled = crowd_map()
+        assert compiled.run(until_first_crash=True) == ticks
+        assert compiled.collisions == stepped.collisions
+        assert [(c.point, c.char) for c in compiled.carts] == [(c.point, c.char) for c in stepped.carts]
+
+    def test_crashed_carts_stop_moving(self):
+        """
+        The first cart hits the second before it has moved. The wreck must stay put, rather than going on to
+        meet the third cart coming up from below.
+        """
+        mine_cart_map = MineCartMap([list("-+"), list(" |"), list(" |")])
+        mine_cart_map.carts = [Cart(">", Point(0, 0)), Cart("v", Point(1, 0)), Cart("^", Point(1, 2))]
+
+        mine_cart_map.step()
+        assert mine_cart_map.collisions == [Point(1, 0)]
+        assert [cart.point for cart in mine_cart_map.carts] == [Point(1, 1)]
 
 
 """
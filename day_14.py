@@ -1,16 +1,39 @@
 import unittest
 
 
+def failure_table(pattern):
+    """
+    KMP failure function: table[i] is the length of the longest proper prefix of pattern[:i + 1] that is also
+    a suffix of it.
+    """
+    table = [0] * len(pattern)
+    k = 0
+
+    for i in range(1, len(pattern)):
+        while k and pattern[i] != pattern[k]:
+            k = table[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        table[i] = k
+
+    return table
+
+
 class RecipeScoreboard:
+    """
+    Recipes are single digits, so the scoreboard is a bytearray holding one digit per byte. A new score is at
+    most 9 + 9 = 18, so its digits come from a comparison rather than a round trip through str.
+    """
 
     def __init__(self):
         self.elf_1 = 0
         self.elf_2 = 1
-        self.recipes = [3, 7]
+        self.recipes = bytearray([3, 7])
+        self.searched = {}  # pattern -> where the next chunked search for it should start
 
     def next(self):
         new_recipe = self.recipes[self.elf_1] + self.recipes[self.elf_2]
-        new_digits = [int(c) for c in str(new_recipe)]
+        new_digits = [1, new_recipe - 10] if new_recipe >= 10 else [new_recipe]
 
         self.recipes.extend(new_digits)
 
@@ -27,13 +50,89 @@ class RecipeScoreboard:
 
     def recipes_before_pattern(self, pattern):
         """
-        Yikes. This is not fast, and it also has an off by one for my test case.
+        Number of recipes to the left of the first appearance of the pattern. A KMP matcher takes the digits
+        one at a time, so the pattern is checked after every digit, including the first of a two digit score,
+        which the old check of the last few digits as a string got wrong.
         """
-        pl = len(pattern) + 1
-        while pattern not in ''.join(str(i) for i in self.recipes[-pl:]):
-            self.next()
+        pattern = [int(c) for c in pattern]
+        table = failure_table(pattern)
+        size = len(pattern)
+        recipes = self.recipes
+        elf_1, elf_2 = self.elf_1, self.elf_2
+        matched = 0
+        found = None
+        i = 0  # digits fed to the matcher so far
+
+        while found is None:
+            if i == len(recipes):
+                new_recipe = recipes[elf_1] + recipes[elf_2]
+                recipes.extend((1, new_recipe - 10) if new_recipe >= 10 else (new_recipe,))
+
+                length = len(recipes)
+                elf_1 = (elf_1 + recipes[elf_1] + 1) % length
+                elf_2 = (elf_2 + recipes[elf_2] + 1) % length
+
+            while i < len(recipes):
+                digit = recipes[i]
+                i += 1
+
+                while matched and digit != pattern[matched]:
+                    matched = table[matched - 1]
+                if digit == pattern[matched]:
+                    matched += 1
+                if matched == size:
+                    found = i - size
+                    break
+
+        self.elf_1, self.elf_2 = elf_1, elf_2
+        return found
+
+    def generate(self, count):
+        """
+        Add at least count more recipes in one tight loop. If it's interrupted, any half finished turn is
+        dropped in the finally block, so the scoreboard is always left as of a whole number of turns. The last
+        whole turn is kept as one (elf_1, elf_2, complete) tuple, so a single rebinding moves both elves and
+        the count together.
+        """
+        recipes = self.recipes
+        committed = (self.elf_1, self.elf_2, len(recipes))
+        target = len(recipes) + count
+
+        try:
+            while committed[2] < target:
+                elf_1, elf_2, _ = committed
+                new_recipe = recipes[elf_1] + recipes[elf_2]
+                if new_recipe >= 10:
+                    recipes.append(1)
+                    new_recipe -= 10
+                recipes.append(new_recipe)
+
+                length = len(recipes)
+                committed = ((elf_1 + recipes[elf_1] + 1) % length, (elf_2 + recipes[elf_2] + 1) % length, length)
+        finally:
+            self.elf_1, self.elf_2, complete = committed
+            del recipes[complete:]
+
+    def recipes_before_pattern_chunked(self, pattern, chunk_size=1 << 20, limit=None):
+        """
+        Same answer as recipes_before_pattern, but the recipes are generated about chunk_size at a time and
+        each chunk is searched with a single bytes find, overlapping the previous chunk by len(pattern) - 1 so
+        no match is missed at the seam. How far the search got is kept in self.searched, so calling again after
+        an interruption, or after giving up at limit recipes (which returns None), carries on from there.
+        """
+        needle = bytes(int(c) for c in pattern)
+
+        while True:
+            found = self.recipes.find(needle, self.searched.get(needle, 0))
+            if found != -1:
+                return found
+
+            self.searched[needle] = max(0, len(self.recipes) - len(needle) + 1)
 
-        return len(self.recipes) - len(pattern)
+            if limit is not None and len(self.recipes) >= limit:
+                return None
+
+            self.generate(chunk_size)
 
 
 class TestRecipes(unittest.TestCase):
@@ -50,11 +149,86 @@ class TestRecipes(unittest.TestCase):
         assert RecipeScoreboard().recipes_before_pattern('92510') == 18
         assert RecipeScoreboard().recipes_before_pattern('59414') == 2018
 
+    def test_failure_table(self):
+        assert failure_table([1, 2, 1, 2, 3]) == [0, 0, 1, 2, 0]
+        assert failure_table([5, 5, 5]) == [0, 1, 2]
+
+    def test_pattern_ending_mid_score(self):
+        """
+        3 + 7 = 10 puts down 1 and 0 together; the pattern 371 ends on the 1, with the 0 already after it.
+        """
+        assert RecipeScoreboard().recipes_before_pattern('371') == 0
+        assert RecipeScoreboard().recipes_before_pattern('3710') == 0
+        assert RecipeScoreboard().recipes_before_pattern('710') == 1
+
+    def test_scoreboard_still_usable_after_search(self):
+        scoreboard = RecipeScoreboard()
+        assert scoreboard.recipes_before_pattern('51589') == 9
+        assert scoreboard.next_10(2018) == '5941429882'
+
+    def test_generate(self):
+        stepped = RecipeScoreboard()
+        for _ in range(5000):
+            stepped.next()
+
+        generated = RecipeScoreboard()
+        while len(generated.recipes) < len(stepped.recipes):
+            generated.generate(7)
+
+        assert generated.recipes[:len(stepped.recipes)] == stepped.recipes
+
+    def test_generate_interrupted(self):
+        """
+        Swap in a scoreboard that raises KeyboardInterrupt on its nth append, which lands both between turns and
+        between the two digits of an 18. Wherever it lands, the scoreboard has to be left exactly as the stepped
+        one was after some whole turn.
+        """
+        class InterruptingRecipes(bytearray):
+
+            def __init__(self, recipes, appends):
+                super().__init__(recipes)
+                self.appends = appends
+
+            def append(self, digit):
+                if not self.appends:
+                    raise KeyboardInterrupt
+                self.appends -= 1
+                super().append(digit)
+
+        stepped = RecipeScoreboard()
+        turns = {len(stepped.recipes): (stepped.elf_1, stepped.elf_2)}
+        for _ in range(40):
+            stepped.next()
+            turns[len(stepped.recipes)] = (stepped.elf_1, stepped.elf_2)
+
+        for appends in range(40):
+            scoreboard = RecipeScoreboard()
+            scoreboard.recipes = InterruptingRecipes(scoreboard.recipes, appends)
+
+            with self.assertRaises(KeyboardInterrupt):
+                scoreboard.generate(50)
+
+            length = len(scoreboard.recipes)
+            assert scoreboard.recipes == stepped.recipes[:length]
+            assert (scoreboard.elf_1, scoreboard.elf_2) == turns[length]
+
+    def test_recipes_before_pattern_chunked(self):
+        for pattern, expected in (('51589', 9), ('01245', 5), ('92510', 18), ('59414', 2018), ('371', 0)):
+            assert RecipeScoreboard().recipes_before_pattern_chunked(pattern, chunk_size=100) == expected
+
+    def test_chunked_search_resumes(self):
+        scoreboard = RecipeScoreboard()
+        assert scoreboard.recipes_before_pattern_chunked('59414', chunk_size=64, limit=1000) is None
+        assert scoreboard.searched[bytes([5, 9, 4, 1, 4])] > 990
+        assert scoreboard.recipes_before_pattern_chunked('59414', chunk_size=64) == 2018
+
     def test_part_1(self):
         print("Part 1:", RecipeScoreboard().next_10(330121))
 
     def test_part_2(self):
-        print("Part 2:", RecipeScoreboard().recipes_before_pattern('330121'))
+        part_2 = RecipeScoreboard().recipes_before_pattern_chunked('330121')
+        print("Part 2:", part_2)
+        assert part_2 == 20216138
 
 
 
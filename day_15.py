@@ -1,6 +1,7 @@
-from collections import namedtuple, defaultdict
+from collections import namedtuple
 from dataclasses import dataclass
 import unittest
+from unittest.mock import patch
 
 
 Point = namedtuple('Point', ['x', 'y'])
@@ -21,15 +22,6 @@ class Unit:
         return self.health <= 0
 
 
-@dataclass
-class Path:
-
-    start: Point
-    goal: Point
-    first_step: Point
-    length: int
-
-
 class Cavern:
 
     def __init__(self, lines, save_the_elves=False):
@@ -96,41 +88,35 @@ class Cavern:
         and does not do any prediction about where units will be later. If the unit cannot reach (find an open path to)
         any of the squares that are in range, it ends its turn. If multiple squares are in range and tied for being
         reachable in the fewest steps, the square which is first in reading order is chosen.
+
+        Both questions are answered with breadth-first searches that visit neighbours in reading order: one out from
+        the unit to find the nearest in-range square, and one back from that square to the unit to find which
+        first step is on a shortest path to it. That's O(cells) per move.
         """
-        enemies = self.enemy_units(unit.race)
+        in_range = {
+            point
+            for enemy in self.enemy_units(unit.race)
+            for point in Cavern.neighbors(enemy.position)
+            if self.tile(point) == '.'
+        }
+
+        if not in_range:
+            return
 
-        paths = []
-        for enemy in enemies:
-            for point in Cavern.neighbors(enemy.position):
-                if self.tile(point) == '.':
-                    path = self.find_path(unit.position, point)
-                    if path is not None:
-                        paths.append(path)
+        distances = self.distances_from(unit.position, goals=in_range)
+        reachable = [point for point in in_range if point in distances]
 
-        if not paths:
+        if not reachable:
             return
 
-        paths.sort(key=lambda p: p.length)  # sort by total steps first
-        shortest = [path for path in paths if path.length == paths[0].length]  # find all paths of shortest length
+        target = min(reachable, key=lambda p: (distances[p], p.y, p.x))  # tie break with reading order on goal tile
 
-        if len(shortest) > 1:
-            shortest.sort(key=lambda p: (p.goal.y, p.goal.x))  # tie break with reading order on goal tile
-
-        """
-        At this point we know where we want to go, but not necessarily how we want to get there. 
-        """
-        target = shortest[0].goal
-        if target in self.neighbors(unit.position):
-            new_position = target
-        else:
-            paths = []
-            for point in self.neighbors(unit.position):
-                if self.tile(point) == '.':
-                    candidate = self.find_path(point, target)
-                    if candidate:
-                        paths.append(candidate)
-            paths.sort(key=lambda p: (p.length, p.start.y, p.start.x))
-            new_position = paths[0].start
+        first_steps = {point for point in Cavern.neighbors(unit.position) if self.tile(point) == '.'}
+        back = self.distances_from(target, goals=first_steps)
+        new_position = min(
+            (point for point in first_steps if point in back),
+            key=lambda p: (back[p], p.y, p.x),
+        )
 
         if new_position in self.units:
             raise Exception("tried to move to an occupied tile")
@@ -168,66 +154,26 @@ class Cavern:
     def sorted_units(self):
         return sorted(self.units.values(), key=lambda u: (u.position.y, u.position.x))
 
-    def find_path(self, start, goal):
+    def distances_from(self, start, goals=None):
         """
-        Straight wikipedia A*
+        Breadth-first search over open squares, returning {point: steps from start}. With goals, it stops as soon as
+        the nearest goal's level is complete, since nothing further away can matter.
         """
-        paths = []
-
-        def reconstruct_path(came_from, current):
-            total_path = [current]
-            while current in came_from.keys():
-                current = came_from[current]
-                total_path.append(current)
-
-            return Path(goal=goal,
-                        start=start,
-                        first_step=total_path[-2],  # 0 is goal, -1 is start, -2 is first step
-                        length=len(total_path))
-
-        def heuristic_cost_estimate(a, b):
-            return abs(a.x - b.x) + abs(a.y - b.y)
-
-        closed_set = set()
-        open_set = {start}
-        came_from = dict()
-        g_score = defaultdict(lambda: 10e6)
-        g_score[start] = 0
-        f_score = defaultdict(lambda: 10e6)
-        f_score[start] = heuristic_cost_estimate(start, goal)
+        distances = {start: 0}
+        frontier = [start]
 
-        while open_set:
-            lowest = None
-            lowest_score = 10e6
-            for point in open_set:
-                if f_score[point] < lowest_score:
-                    lowest = point
-                    lowest_score = f_score[point]
-            current = lowest
+        while frontier and not (goals is not None and any(point in goals for point in frontier)):
+            next_frontier = []
 
-            if current == goal:
-                return reconstruct_path(came_from, current)
+            for point in frontier:
+                for neighbor in Cavern.neighbors(point):
+                    if neighbor not in distances and self.tile(neighbor) == '.':
+                        distances[neighbor] = distances[point] + 1
+                        next_frontier.append(neighbor)
 
-            open_set.remove(current)
-            closed_set.add(current)
+            frontier = next_frontier
 
-            for neighbor in Cavern.neighbors(current):
-                if self.tile(neighbor) != '.':
-                    closed_set.add(neighbor)
-
-                if neighbor in closed_set:
-                    continue
-
-                tentative_gscore = g_score[current] + 1
-
-                if neighbor not in open_set:
-                    open_set.add(neighbor)
-                elif tentative_gscore >= g_score[neighbor]:
-                    continue
-
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_gscore
-                f_score[neighbor] = g_score[neighbor] + heuristic_cost_estimate(neighbor, goal)
+        return distances
 
 
 class Battle:
@@ -299,6 +245,31 @@ class TestBattle(unittest.TestCase):
     def test_sample_battle_6(self):
         self.harness("input/day_15_test_6.txt", 20, 18740)
 
+    def test_move_tie_breaks(self):
+        """
+        The elf can reach two in-range squares in three steps and takes the first in reading order, 4,2. Going
+        right or going down are both shortest paths there, so it takes the first in reading order: right.
+        """
+        cavern = Cavern(["#######", "#.E...#", "#.....#", "#...G.#", "#######"])
+        elf = cavern.units[Point(2, 1)]
+
+        assert cavern.distances_from(elf.position)[Point(4, 2)] == 3
+        cavern.try_to_move_unit(elf)
+        assert elf.position == Point(3, 1)
+
+    def test_move_with_nothing_in_range(self):
+        """
+        The goblin is walled in, so there are no in-range squares and the elf stays put without searching.
+        """
+        cavern = Cavern(["#######", "#.E..##", "#...#G#", "#######"])
+        elf = cavern.units[Point(2, 1)]
+
+        with patch.object(cavern, "distances_from") as distances_from:
+            cavern.try_to_move_unit(elf)
+
+        distances_from.assert_not_called()
+        assert elf.position == Point(2, 1)
+
     def test_real_battle_part_1(self):
         cavern = Cavern.cavern_from_file("input/day_15.txt")
         battle = Battle(cavern)